@@ -0,0 +1,399 @@
+# backend/analysis_jobs.py
+"""Background dataset analysis jobs.
+
+Jobs are rows of the ``analysis_jobs`` table in the reports catalog
+(storage.DB_PATH), so their state survives restarts, and an
+AnalysisJobQueue runs them on a pool of worker threads inside the server
+process; no external broker is involved.
+
+Each job checkpoints its row offset (``processed``) after every batch whose
+reports have been stored.  A running job is owned by the queue that claimed
+it, which refreshes the job's heartbeat while it runs.  A job whose owner
+stopped heartbeating (the process died) is queued again and resumed from its
+checkpoint by the next queue that notices, so a queue started in a second
+process never takes over jobs that are still running elsewhere.
+
+Resuming is at-least-once: reports are stored before the checkpoint that
+records them, so the reports of the batch in flight when a process died are
+stored again when the job resumes (at most one batch per interruption).
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+  id TEXT PRIMARY KEY,
+  dataset_id TEXT NOT NULL,
+  filename TEXT NOT NULL,
+  row_limit INTEGER NOT NULL,
+  stability_mode TEXT,
+  status TEXT NOT NULL,
+  processed INTEGER NOT NULL DEFAULT 0,
+  total_rows INTEGER,
+  labels TEXT NOT NULL DEFAULT '{}',
+  confidence_sum REAL NOT NULL DEFAULT 0,
+  preview TEXT NOT NULL DEFAULT '[]',
+  cancel_requested INTEGER NOT NULL DEFAULT 0,
+  owner TEXT,
+  heartbeat REAL,
+  error TEXT,
+  created_at TEXT NOT NULL,
+  started_at TEXT,
+  updated_at TEXT NOT NULL,
+  finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_created_at ON analysis_jobs(created_at);
+"""
+
+JOB_STATUSES = ("queued", "running", "completed", "failed", "cancelled")
+FINISHED_STATUSES = frozenset({"completed", "failed", "cancelled"})
+
+# Results kept with a job for /result, as the synchronous endpoint returned.
+PREVIEW_SIZE = 10
+
+# Seconds between heartbeats of a queue's running jobs, and without one after
+# which a running job is taken to be orphaned and queued again.
+HEARTBEAT_INTERVAL = 10.0
+STALE_AFTER = 60.0
+
+JOB_SELECT_SQL = """SELECT id, dataset_id, filename, row_limit, stability_mode, status, processed,
+  total_rows, labels, confidence_sum, preview, cancel_requested, error, created_at, started_at,
+  updated_at, finished_at FROM analysis_jobs"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def init_jobs():
+    with storage.connection() as conn:
+        conn.executescript(JOB_SCHEMA)
+        conn.commit()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(analysis_jobs)")}
+        with conn:
+            # Tables created before jobs had owners.
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE analysis_jobs ADD COLUMN owner TEXT")
+            if "heartbeat" not in columns:
+                conn.execute("ALTER TABLE analysis_jobs ADD COLUMN heartbeat REAL")
+
+
+def _job_from_row(row) -> dict[str, Any]:
+    processed, total_rows, status = row["processed"], row["total_rows"], row["status"]
+    if status == "completed":
+        progress = 1.0
+    elif total_rows:
+        progress = round(min(processed / total_rows, 1.0), 4)
+    else:
+        progress = 0.0
+    return {
+        "job_id": row["id"],
+        "dataset_id": row["dataset_id"],
+        "filename": row["filename"],
+        "status": status,
+        "limit": row["row_limit"],
+        "stability_mode": row["stability_mode"],
+        "processed": processed,
+        "total_rows": total_rows,
+        "progress": progress,
+        "cancel_requested": bool(row["cancel_requested"]),
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "updated_at": row["updated_at"],
+        "finished_at": row["finished_at"],
+    }
+
+
+class AnalysisJobQueue:
+    """Runs analysis jobs on ``workers`` background threads.
+
+    ``runner(job, start)`` is called with the job dict and the number of
+    data rows already analyzed; it returns a generator that analyzes the
+    rest of the dataset and yields each batch of analysis results once
+    their reports are stored.  After every batch the queue checkpoints the
+    row offset, label counts and preview, and stops the job if it has been
+    cancelled.  ``close()`` (also run at interpreter exit) stops the workers
+    at their next batch boundary and leaves unfinished jobs queued.
+
+    Every ``heartbeat_interval`` seconds a monitor thread refreshes the
+    heartbeat of the jobs this queue runs and queues again (here) running
+    jobs whose heartbeat is older than ``stale_after`` seconds.  A queue that
+    loses a job that way (it was stalled for longer than ``stale_after``)
+    stops it at its next batch boundary.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[dict, int], Iterator[list[dict]]],
+        workers: int = 2,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL,
+        stale_after: float = STALE_AFTER,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if stale_after <= heartbeat_interval:
+            raise ValueError("stale_after must be longer than heartbeat_interval")
+        self.runner = runner
+        self.workers = workers
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.owner = uuid.uuid4().hex
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = threading.Event()
+        init_jobs()
+        self._requeue_stale()
+        with storage.connection() as conn:
+            pending = conn.execute(
+                "SELECT id FROM analysis_jobs WHERE status = 'queued' ORDER BY created_at, rowid"
+            ).fetchall()
+        for row in pending:
+            self._queue.put(row[0])
+        self._threads = [
+            threading.Thread(target=self._run, name=f"analysis-job-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._monitor = threading.Thread(target=self._heartbeat, name="analysis-job-heartbeat", daemon=True)
+        self._monitor.start()
+        atexit.register(self.close)
+
+    def submit(
+        self,
+        dataset_id: str,
+        filename: str,
+        limit: int,
+        stability_mode: str | None = None,
+        total_rows: int | None = None,
+    ) -> dict[str, Any]:
+        """Queue a new job and return it (status ``queued``)."""
+        if self._closed.is_set():
+            raise RuntimeError("Job queue is closed")
+        job_id = uuid.uuid4().hex
+        now = _now()
+        with storage.connection() as conn:
+            with conn:
+                conn.execute(
+                    """INSERT INTO analysis_jobs(id, dataset_id, filename, row_limit, stability_mode,
+                    status, total_rows, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)""",
+                    (job_id, dataset_id, filename, limit, stability_mode, total_rows, now, now),
+                )
+        self._queue.put(job_id)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        with storage.connection() as conn:
+            row = conn.execute(f"{JOB_SELECT_SQL} WHERE id = ?", (job_id,)).fetchone()
+        return _job_from_row(row) if row is not None else None
+
+    def list_jobs(self, status: str | None = None, limit: int = 50) -> list[dict[str, Any]]:
+        """Most recent jobs first, optionally only those with ``status``."""
+        sql, params = JOB_SELECT_SQL, []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY created_at DESC, rowid DESC LIMIT ?"
+        params.append(max(1, min(limit, 500)))
+        with storage.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [_job_from_row(row) for row in rows]
+
+    def cancel(self, job_id: str) -> dict[str, Any] | None:
+        """Cancel a queued job now, or ask a running one to stop after its current batch."""
+        now = _now()
+        with storage.connection() as conn:
+            with conn:
+                conn.execute(
+                    """UPDATE analysis_jobs SET status = 'cancelled', cancel_requested = 1,
+                    finished_at = ?, updated_at = ? WHERE id = ? AND status = 'queued'""",
+                    (now, now, job_id),
+                )
+                conn.execute(
+                    """UPDATE analysis_jobs SET cancel_requested = 1, updated_at = ?
+                    WHERE id = ? AND status = 'running'""",
+                    (now, job_id),
+                )
+        return self.get(job_id)
+
+    def result(self, job_id: str) -> dict[str, Any] | None:
+        """The job with its label counts, mean confidence and first results."""
+        with storage.connection() as conn:
+            row = conn.execute(f"{JOB_SELECT_SQL} WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        processed = row["processed"]
+        return {
+            "job": _job_from_row(row),
+            "labels": json.loads(row["labels"]),
+            "mean_confidence": round(row["confidence_sum"] / processed, 4) if processed else 0.0,
+            "results": json.loads(row["preview"]),
+        }
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._monitor.join()
+
+    def stats(self) -> dict[str, Any]:
+        with storage.connection() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM analysis_jobs GROUP BY status").fetchall())
+        return {"workers": self.workers, "jobs": {status: counts.get(status, 0) for status in JOB_STATUSES}}
+
+    def _heartbeat(self):
+        while not self._closed.wait(self.heartbeat_interval):
+            try:
+                with storage.connection() as conn:
+                    with conn:
+                        conn.execute(
+                            "UPDATE analysis_jobs SET heartbeat = ? WHERE owner = ? AND status = 'running'",
+                            (time.time(), self.owner),
+                        )
+                for job_id in self._requeue_stale():
+                    self._queue.put(job_id)
+            except Exception:
+                logger.exception("Analysis job heartbeat failed")
+
+    def _requeue_stale(self) -> list[str]:
+        """Queue running jobs whose owner stopped heartbeating; returns their ids."""
+        cutoff = time.time() - self.stale_after
+        with storage.connection() as conn:
+            with conn:
+                stale = conn.execute(
+                    """SELECT id FROM analysis_jobs WHERE status = 'running'
+                    AND (heartbeat IS NULL OR heartbeat < ?) ORDER BY created_at, rowid""",
+                    (cutoff,),
+                ).fetchall()
+                requeued = []
+                for row in stale:
+                    # Checked again per row: the owner may have heartbeated since.
+                    if conn.execute(
+                        """UPDATE analysis_jobs SET status = 'queued', owner = NULL, updated_at = ?
+                        WHERE id = ? AND status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)""",
+                        (_now(), row[0], cutoff),
+                    ).rowcount:
+                        requeued.append(row[0])
+        for job_id in requeued:
+            logger.warning("Analysis job %s lost its worker; resuming it from its checkpoint", job_id)
+        return requeued
+
+    def _run(self):
+        while not self._closed.is_set():
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            try:
+                self._execute(job_id)
+            except Exception:
+                logger.exception("Analysis job %s could not be run", job_id)
+
+    def _execute(self, job_id: str):
+        now = _now()
+        with storage.connection() as conn:
+            with conn:
+                # Claiming the row keeps a job from running twice (e.g. queued
+                # again on restart while a cancel was racing with it).
+                claimed = conn.execute(
+                    """UPDATE analysis_jobs SET status = 'running', owner = ?, heartbeat = ?,
+                    started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ? AND status = 'queued'""",
+                    (self.owner, time.time(), now, now, job_id),
+                ).rowcount
+            if not claimed:
+                return
+            row = conn.execute(f"{JOB_SELECT_SQL} WHERE id = ?", (job_id,)).fetchone()
+
+        job = _job_from_row(row)
+        processed = row["processed"]
+        labels = Counter(json.loads(row["labels"]))
+        confidence_sum = row["confidence_sum"]
+        preview = json.loads(row["preview"])
+        try:
+            with closing(self.runner(job, processed)) as batches:
+                for batch in batches:
+                    processed += len(batch)
+                    for result in batch:
+                        labels[result["prediction"]["label"]] += 1
+                        confidence_sum += result["prediction"]["confidence"]
+                    preview.extend(batch[: max(PREVIEW_SIZE - len(preview), 0)])
+                    stop = self._checkpoint(job_id, processed, labels, confidence_sum, preview)
+                    if stop == "released":
+                        logger.warning("Analysis job %s was taken over by another queue", job_id)
+                        return
+                    if stop == "cancelled":
+                        self._finish(job_id, "cancelled")
+                        return
+                    if self._closed.is_set():
+                        self._set_status(job_id, "queued")
+                        return
+        except Exception as exception:
+            logger.exception("Analysis job %s failed", job_id)
+            self._finish(job_id, "failed", f"{type(exception).__name__}: {exception}")
+            return
+        self._finish(job_id, "completed")
+
+    def _checkpoint(
+        self, job_id: str, processed: int, labels: Counter, confidence_sum: float, preview: list
+    ) -> str | None:
+        """Store the job's progress and refresh its heartbeat.
+
+        Returns why the job must stop: ``"cancelled"`` when it has been asked
+        to cancel, ``"released"`` when this queue no longer owns it.
+        """
+        with storage.connection() as conn:
+            with conn:
+                owned = conn.execute(
+                    """UPDATE analysis_jobs SET processed = ?, labels = ?, confidence_sum = ?, preview = ?,
+                    heartbeat = ?, updated_at = ? WHERE id = ? AND owner = ? AND status = 'running'""",
+                    (
+                        processed,
+                        json.dumps(labels),
+                        confidence_sum,
+                        json.dumps(preview),
+                        time.time(),
+                        _now(),
+                        job_id,
+                        self.owner,
+                    ),
+                ).rowcount
+                row = conn.execute("SELECT cancel_requested FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+        if not owned:
+            return "released"
+        return "cancelled" if row and row[0] else None
+
+    def _finish(self, job_id: str, status: str, error: str | None = None):
+        now = _now()
+        with storage.connection() as conn:
+            with conn:
+                conn.execute(
+                    """UPDATE analysis_jobs SET status = ?, error = ?, owner = NULL, finished_at = ?, updated_at = ?
+                    WHERE id = ? AND owner = ?""",
+                    (status, error, now, now, job_id, self.owner),
+                )
+
+    def _set_status(self, job_id: str, status: str):
+        with storage.connection() as conn:
+            with conn:
+                conn.execute(
+                    "UPDATE analysis_jobs SET status = ?, owner = NULL, updated_at = ? WHERE id = ? AND owner = ?",
+                    (status, _now(), job_id, self.owner),
+                )
@@ -0,0 +1,269 @@
+# backend/api_check.py
+"""Regression checks for API edge cases that earlier changes got wrong.
+
+Each check drives the Flask app through its test client against temporary
+storage (the reports database, uploads and datasets.json all live in a
+temporary directory) with the heuristic predictor, so no trained model is
+needed.  Prints a JSON report and exits with status 1 when any check fails.
+
+Usage: python api_check.py
+"""
+import csv
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import datasets_storage
+import storage
+
+WORK_DIR = Path(tempfile.mkdtemp())
+# Importing server opens the reports database; keep it away from the real one.
+storage.DB_PATH = WORK_DIR / "reports.db"
+datasets_storage.UPLOAD_DIR = WORK_DIR / "uploads"
+datasets_storage.META_PATH = WORK_DIR / "datasets.json"
+
+import server  # noqa: E402
+from feature_cache import open_feature_cache  # noqa: E402
+from ml.inference import MLPredictor  # noqa: E402
+from ml.schema import CIC_COLUMN_ALIASES  # noqa: E402
+from request_coalescer import RequestCoalescer  # noqa: E402
+
+GOOD_EVENT = {"source_ip": "10.0.0.7", "destination_ip": "10.0.0.5", "destination_port": 22, "failed_logins": 3}
+BAD_EVENT = {"source_ip": "10.0.0.8", "destination_port": "abc"}
+
+
+def _check(report: dict, name: str, passed: bool, **details):
+    report["checks"][name] = {"passed": bool(passed), **details}
+
+
+def check_coalesced_bad_request(report: dict):
+    """One invalid /api/v1/analyze request in a coalesced batch fails only itself."""
+    previous = server.COALESCE_ANALYZE
+    server.COALESCE_ANALYZE = True
+    # A long window so all requests below land in one batch.
+    server.analyze_coalescer = RequestCoalescer(server._coalesced_analysis_responses, max_batch=5, max_wait_ms=500)
+    statuses: dict[int, int] = {}
+
+    def post(position: int, event: dict):
+        statuses[position] = server.app.test_client().post("/api/v1/analyze", json={"event": event}).status_code
+
+    try:
+        threads = [threading.Thread(target=post, args=(position, GOOD_EVENT)) for position in range(4)]
+        threads.append(threading.Thread(target=post, args=(4, BAD_EVENT)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.analyze_coalescer.close()
+        server.analyze_coalescer = None
+        server.COALESCE_ANALYZE = previous
+    expected = {0: 200, 1: 200, 2: 200, 3: 200, 4: 400}
+    _check(report, "coalesced_bad_request", statuses == expected, statuses=statuses)
+
+    # A handler result that is an exception reaches that caller only.
+    coalescer = RequestCoalescer(
+        lambda items: [ValueError(item) if item < 0 else item * 2 for item in items], max_batch=3, max_wait_ms=500
+    )
+    outcomes: dict[int, str] = {}
+
+    def submit(item: int):
+        try:
+            outcomes[item] = str(coalescer.submit(item))
+        except ValueError:
+            outcomes[item] = "error"
+
+    threads = [threading.Thread(target=submit, args=(item,)) for item in (1, -1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    coalescer.close()
+    batches = coalescer.stats()["batches"]
+    _check(
+        report,
+        "coalescer_per_item_exception",
+        outcomes == {1: "2", -1: "error", 2: "4"} and batches == 1,
+        outcomes=outcomes,
+        batches=batches,
+    )
+
+
+def check_changes_etag_paging(report: dict):
+    """Following ``has_more`` with the last ETag still returns every pending report."""
+    client = server.app.test_client()
+    since = storage.latest_report_id()
+    for _ in range(5):
+        client.post("/api/v1/analyze", json={"event": GOOD_EVENT})
+    expected = list(range(since + 1, storage.latest_report_id() + 1))
+    seen, etag, pages, not_modified = [], None, 0, 0
+    while pages < 10:
+        headers = {"If-None-Match": etag} if etag else {}
+        response = client.get(f"/api/v1/reports/changes?since={since}&limit=2&fields=id", headers=headers)
+        pages += 1
+        if response.status_code == 304:
+            not_modified += 1
+            break
+        body = response.get_json()
+        seen.extend(item["id"] for item in body["items"])
+        etag, since = response.headers["ETag"], body["next_since"]
+        if not body["has_more"]:
+            break
+    caught_up = client.get(f"/api/v1/reports/changes?since={since}", headers={"If-None-Match": etag}).status_code
+    _check(
+        report,
+        "changes_etag_paging",
+        len(expected) == 5 and seen == expected and not_modified == 0 and caught_up == 304,
+        expected=expected,
+        seen=seen,
+        caught_up_status=caught_up,
+    )
+
+
+def check_batch_bad_event(report: dict):
+    """A malformed event fails its batch with 400 naming the event; oversize batches get 413."""
+    client = server.app.test_client()
+    before = storage.latest_report_id()
+    events = [GOOD_EVENT, GOOD_EVENT, BAD_EVENT, GOOD_EVENT]
+    response = client.post("/api/v1/analyze/batch", json=events)
+    error = (response.get_json() or {}).get("error", "")
+    ndjson = client.post(
+        "/api/v1/analyze/batch",
+        data="\n".join(json.dumps(event) for event in events),
+        content_type="application/x-ndjson",
+    )
+    stored = storage.latest_report_id() - before
+    _check(
+        report,
+        "batch_bad_event",
+        response.status_code == 400 and error.startswith("Event 3:") and ndjson.status_code == 400 and stored == 0,
+        status=response.status_code,
+        error=error,
+        ndjson_status=ndjson.status_code,
+        stored_reports=stored,
+    )
+
+    limits = server.BATCH_MAX_EVENTS, server.BATCH_MAX_BYTES
+    try:
+        server.BATCH_MAX_EVENTS = 3
+        too_many = client.post("/api/v1/analyze/batch", json=events).status_code
+        server.BATCH_MAX_EVENTS, server.BATCH_MAX_BYTES = limits[0], 200
+        too_large = client.post("/api/v1/analyze/batch", json=events).status_code
+    finally:
+        server.BATCH_MAX_EVENTS, server.BATCH_MAX_BYTES = limits
+    good = client.post("/api/v1/analyze/batch", json=[GOOD_EVENT, GOOD_EVENT])
+    _check(
+        report,
+        "batch_limits",
+        too_many == 413 and too_large == 413 and good.status_code == 200 and good.get_json()["processed"] == 2,
+        too_many_status=too_many,
+        too_large_status=too_large,
+        good_status=good.status_code,
+    )
+
+
+def check_dataset_cache_built_lazily(report: dict):
+    """A dataset stored before feature caches existed gets one from its first analysis."""
+    dataset_id = "check-before-cache"
+    stored_name = f"{dataset_id}_flows.csv"
+    names = [aliases[0] for aliases in CIC_COLUMN_ALIASES.values()]
+    with open(datasets_storage.UPLOAD_DIR / stored_name, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["Source IP", "Destination IP", *names, "Label"])
+        for index in range(50):
+            writer.writerow([f"192.168.10.{index}", "10.0.0.5", *[index * 7 % 1000 for _ in names], "BENIGN"])
+    # Written directly, as an upload from before the cache would have left it.
+    datasets_storage.META_PATH.write_text(
+        json.dumps([{"dataset_id": dataset_id, "filename": "flows.csv", "stored_name": stored_name}]),
+        encoding="utf-8",
+    )
+    source = datasets_storage.UPLOAD_DIR / stored_name
+    cached_before = open_feature_cache(source) is not None
+    client = server.app.test_client()
+
+    def analyze():
+        response = client.post(f"/api/v1/datasets/{dataset_id}/analyze?stream=ndjson&limit=0")
+        return response.status_code, response.get_data(as_text=True).count("\n")
+
+    first = analyze()
+    deadline = time.monotonic() + 30
+    while open_feature_cache(source) is None and time.monotonic() < deadline:
+        time.sleep(0.1)
+    cached_after = open_feature_cache(source) is not None
+    second = analyze()
+    _check(
+        report,
+        "dataset_cache_built_lazily",
+        not cached_before and cached_after and first[0] == 200 and first == second,
+        cached_before=cached_before,
+        cached_after=cached_after,
+        first=first,
+        second=second,
+    )
+
+
+WRITER_SCRIPT = """
+import sys
+from pathlib import Path
+import storage
+storage.DB_PATH = Path(sys.argv[1])
+report = {"label": "BENIGN", "confidence": 0.5, "decision_status": "check"}
+for size in range(1, int(sys.argv[2]) + 1):
+    storage.insert_reports([report] * (size % 7 + 1))
+"""
+
+
+def check_changes_across_processes(report: dict):
+    """Two processes writing reports at once: the changes feed still sees every id, in order."""
+    since = start = storage.latest_report_id()
+    writers = [
+        subprocess.Popen([sys.executable, "-c", WRITER_SCRIPT, str(storage.DB_PATH), "150"], cwd=Path(__file__).parent)
+        for _ in range(2)
+    ]
+    seen: list[int] = []
+    while True:
+        running = any(writer.poll() is None for writer in writers)
+        items, latest, since = storage.report_changes(since, ("id",), 50)
+        seen.extend(item["id"] for item in items)
+        if not running and since >= latest:
+            break
+    returncodes = [writer.returncode for writer in writers]
+    expected = list(range(start + 1, storage.latest_report_id() + 1))
+    _check(
+        report,
+        "changes_across_processes",
+        returncodes == [0, 0] and len(expected) == 2 * 597 and seen == expected,
+        writer_returncodes=returncodes,
+        expected_reports=len(expected),
+        seen_reports=len(seen),
+        out_of_order=sum(left >= right for left, right in zip(seen, seen[1:])),
+        missing=len(set(expected) - set(seen)),
+    )
+
+
+CHECKS = (
+    check_coalesced_bad_request,
+    check_changes_etag_paging,
+    check_batch_bad_event,
+    check_dataset_cache_built_lazily,
+    check_changes_across_processes,
+)
+
+
+def main():
+    datasets_storage.UPLOAD_DIR.mkdir(parents=True)
+    server.predictor = MLPredictor(WORK_DIR / "missing.joblib", inference_model_path=WORK_DIR / "missing.joblib")
+    report = {"checks": {}}
+    for check in CHECKS:
+        check(report)
+    report["passed"] = all(check["passed"] for check in report["checks"].values())
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# backend/csv_benchmark.py
+"""CSV row → event conversion speed on a CIC-IDS2017-shaped file.
+
+Compares two ways of turning rows into analysis events (no model calls):
+
+* ``per_row``: csv.DictReader with the alias search over every row's keys
+  (how server.py worked before column plans);
+* ``plan``: csv.reader plus a _CsvColumnPlan resolved once from the header,
+  as the CSV and dataset endpoints do now.
+
+Usage: python csv_benchmark.py --rows 50000
+"""
+import argparse
+import csv
+import io
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from ml.schema import CIC_COLUMN_ALIASES
+
+import storage
+
+# Importing server opens the reports database; keep it away from the real one.
+storage.DB_PATH = Path(tempfile.mkdtemp()) / "reports.db"
+
+import server  # noqa: E402
+
+
+def _cic_csv(rows: int, seed: int) -> str:
+    """CIC-IDS2017 layout: the CIC column names (most with a leading space), IPs and a Label."""
+    rng = random.Random(seed)
+    names = [aliases[0] for aliases in CIC_COLUMN_ALIASES.values()]
+    header = ["Flow ID", " Source IP", " Source Port", " Destination IP", " Timestamp"]
+    header += [name if index % 4 == 0 else f" {name}" for index, name in enumerate(names)] + [" Label"]
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(header)
+    for index in range(rows):
+        writer.writerow(
+            [f"flow-{index}", f"192.168.10.{index % 250}", rng.randrange(1024, 65535), "10.0.0.5", "7/7/2017 3:30"]
+            + [rng.choice(("0", str(rng.randrange(1_000_000)), f"{rng.random() * 1e4:.3f}")) for _ in names]
+            + [rng.choice(("BENIGN", "DDoS", "PortScan"))]
+        )
+    return output.getvalue()
+
+
+def _per_row_events(text: str) -> int:
+    count = 0
+    for index, row in enumerate(csv.DictReader(io.StringIO(text)), start=1):
+        # The column mapping is resolved again for every row.
+        server._event_from_csv_row(index, list(row.values()), "benchmark.csv", server._CsvColumnPlan(list(row)))
+        count += 1
+    return count
+
+
+def _plan_events(text: str) -> int:
+    rows = csv.reader(io.StringIO(text, newline=""))
+    plan = server._CsvColumnPlan(next(rows))
+    count = 0
+    for index, values in enumerate((values for values in rows if values), start=1):
+        server._event_from_csv_row(index, values, "benchmark.csv", plan)
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CSV row to event conversion, per-row alias search vs column plan.")
+    parser.add_argument("--rows", type=int, default=50_000, help="Rows in the generated CIC-shaped CSV")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for the generated values")
+    args = parser.parse_args()
+
+    text = _cic_csv(args.rows, args.seed)
+    report = {"config": vars(args), "modes": {}}
+    for mode, convert in (("per_row", _per_row_events), ("plan", _plan_events)):
+        started = time.perf_counter()
+        rows = convert(text)
+        elapsed = time.perf_counter() - started
+        report["modes"][mode] = {
+            "rows": rows,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(rows / elapsed, 1),
+        }
+    report["speedup"] = round(report["modes"]["plan"]["rows_per_second"] / report["modes"]["per_row"]["rows_per_second"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
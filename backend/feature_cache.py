@@ -0,0 +1,179 @@
+# backend/feature_cache.py
+"""Binary columnar cache of an uploaded dataset's analysis inputs.
+
+Built once per stored CSV (in the background after upload) so analyses do
+not parse the CSV text again.  A cache is a directory next to the upload,
+``uploads/feature_cache/<stored_name>/``, holding:
+
+* ``features.f64``: an (N, 77) float64 matrix in CANONICAL_FEATURES order,
+  already mapped by ml.preprocessing.harmonize_frame.  It holds exactly the
+  values the CSV chunk reader produces (float32 would round CIC's
+  microsecond counters and move values across split thresholds), so
+  analyses give the same results with or without the cache;
+* ``column_<i>.offsets`` / ``column_<i>.data``: the text of every CSV column
+  feeding a legacy event field (IPs, ports, protocol, label, ...), as
+  N + 1 int64 end offsets into the column's concatenated UTF-8 bytes;
+* ``manifest.json``: row count, CSV header, cached columns and the size and
+  mtime of the CSV it was built from.
+
+Everything is opened as read-only memory maps and sliced without copying.
+A cache whose manifest does not match the CSV on disk (or this format) is
+ignored.
+"""
+from __future__ import annotations
+
+import json
+import shutil
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+from ml.schema import CANONICAL_FEATURES
+
+FORMAT_VERSION = 2
+FEATURES_FILE = "features.f64"
+MANIFEST_FILE = "manifest.json"
+
+
+def cache_dir(source: Path) -> Path:
+    """Directory of the cache for the stored CSV ``source``."""
+    return source.parent / "feature_cache" / source.name
+
+
+def _source_stamp(source: Path) -> dict[str, int]:
+    stat = source.stat()
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+def build_feature_cache(
+    source: Path,
+    header: list[str],
+    legacy_columns: list[int],
+    chunks: Iterable[tuple[list[int], list[list[str]], np.ndarray]],
+) -> Path:
+    """Write the cache for ``source`` from its (legacy columns, legacy rows, matrix) chunks.
+
+    The cache is written to a temporary directory and moved into place only
+    when complete, so readers never see a partial cache.  Exceptions from
+    ``chunks`` propagate and leave no cache behind.
+    """
+    target = cache_dir(source)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    stamp = _source_stamp(source)
+    building = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+    building.mkdir()
+    try:
+        rows = 0
+        with ExitStack() as files:
+            features = files.enter_context(open(building / FEATURES_FILE, "wb"))
+            columns = {}
+            for column in legacy_columns:
+                offset_file = files.enter_context(open(building / f"column_{column}.offsets", "wb"))
+                data_file = files.enter_context(open(building / f"column_{column}.data", "wb"))
+                offset_file.write(np.zeros(1, dtype=np.int64).tobytes())
+                columns[column] = (offset_file, data_file)
+            written = dict.fromkeys(legacy_columns, 0)
+            for _, legacy_rows, matrix in chunks:
+                features.write(np.ascontiguousarray(matrix, dtype=np.float64).tobytes())
+                for position, column in enumerate(legacy_columns):
+                    encoded = [str(row[position]).encode("utf-8") for row in legacy_rows]
+                    ends = np.cumsum([len(value) for value in encoded], dtype=np.int64) + written[column]
+                    offset_file, data_file = columns[column]
+                    offset_file.write(ends.tobytes())
+                    data_file.write(b"".join(encoded))
+                    if len(ends):
+                        written[column] = int(ends[-1])
+                rows += len(matrix)
+
+        manifest = {
+            "version": FORMAT_VERSION,
+            "rows": rows,
+            "features": list(CANONICAL_FEATURES),
+            "header": list(header),
+            "legacy_columns": list(legacy_columns),
+            **stamp,
+        }
+        (building / MANIFEST_FILE).write_text(json.dumps(manifest), encoding="utf-8")
+        if target.exists():
+            shutil.rmtree(target)
+        building.rename(target)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+    return target
+
+
+def open_feature_cache(source: Path) -> "FeatureCache | None":
+    """The cache built from ``source`` as it is now, or None when there is no valid one."""
+    directory = cache_dir(source)
+    try:
+        manifest = json.loads((directory / MANIFEST_FILE).read_text(encoding="utf-8"))
+        current = _source_stamp(source)
+    except (OSError, ValueError):
+        return None
+    if (
+        manifest.get("version") != FORMAT_VERSION
+        or manifest.get("features") != list(CANONICAL_FEATURES)
+        or any(manifest.get(key) != value for key, value in current.items())
+    ):
+        return None
+    return FeatureCache(directory, manifest)
+
+
+def _memmap(path: Path, dtype, shape: tuple[int, ...]) -> np.ndarray:
+    if not shape[0]:
+        # Empty files cannot be memory-mapped.
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+class FeatureCache:
+    """Read-only view of a built cache; see the module docstring for the layout."""
+
+    def __init__(self, directory: Path, manifest: dict[str, Any]):
+        self.directory = directory
+        self.rows: int = manifest["rows"]
+        self.header: list[str] = manifest["header"]
+        self.legacy_columns: list[int] = manifest["legacy_columns"]
+        self.features = _memmap(directory / FEATURES_FILE, np.float64, (self.rows, len(CANONICAL_FEATURES)))
+        self._columns = {}
+        for column in self.legacy_columns:
+            offsets = _memmap(directory / f"column_{column}.offsets", np.int64, (self.rows + 1,))
+            data_path = directory / f"column_{column}.data"
+            size = data_path.stat().st_size
+            data = _memmap(data_path, np.uint8, (size,))
+            self._columns[column] = (offsets, data)
+
+    def legacy_rows(self, start: int, stop: int) -> list[list[str]]:
+        """Legacy column text of rows ``start:stop``, one list per row in ``legacy_columns`` order."""
+        columns = []
+        for column in self.legacy_columns:
+            offsets, data = self._columns[column]
+            ends = offsets[start : stop + 1].tolist()
+            if not ends:
+                columns.append([])
+                continue
+            base = ends[0]
+            blob = data[base : ends[-1]].tobytes()
+            columns.append(
+                [blob[begin - base : end - base].decode("utf-8") for begin, end in zip(ends, ends[1:])]
+            )
+        if not columns:
+            return [[] for _ in range(max(min(stop, self.rows) - start, 0))]
+        return [list(row) for row in zip(*columns)]
+
+    def chunks(
+        self, start: int, limit: int, size: int
+    ) -> Iterator[tuple[list[int], list[list[str]], np.ndarray]]:
+        """(legacy columns, legacy rows, feature matrix view) for rows ``start`` up to ``limit``.
+
+        Same shape as the CSV chunk reader's output; ``limit <= 0`` means
+        every row.  The matrices are slices of the memory map.
+        """
+        stop = self.rows if limit <= 0 else min(self.rows, limit)
+        for begin in range(start, stop, max(size, 1)):
+            end = min(begin + size, stop)
+            yield self.legacy_columns, self.legacy_rows(begin, end), self.features[begin:end]
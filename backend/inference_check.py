@@ -0,0 +1,206 @@
+# backend/inference_check.py
+"""Regression check: every inference path scores a dataset identically.
+
+Trains a small imputer → scaler → RandomForest pipeline on a synthetic
+CIC-IDS2017-shaped file (raw column names, microsecond counters above 2^24,
+fractional values, blank, negative and infinite cells, ports above 65535)
+and compares, on a second file of the same shape:
+
+* ``compiled``: CompiledForest.predict_proba against the pipeline's
+  ``predict_proba``, bit for bit;
+* ``folded``: the train_model inference artifact (scaler folded into the
+  thresholds) against the pipeline, labels only, as documented;
+* ``predictor``: MLPredictor's compiled and artifact engines against its
+  sklearn engine, and the matrix path against the feature-dict path;
+* ``dataset``: /api/v1/analyze/csv (row path), the stored-dataset chunk path
+  and the feature cache path against each other.
+
+Everything runs in a temporary directory.  Exits with status 1 when any
+check fails.
+
+Usage: python inference_check.py --rows 400 --trees 24
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+from dataclasses import asdict
+from pathlib import Path
+
+# Identical inputs must be scored, not served from the prediction cache.
+os.environ["IDS_PREDICTION_CACHE_SIZE"] = "0"
+
+import pandas as pd  # noqa: E402
+from joblib import dump  # noqa: E402
+
+import datasets_storage  # noqa: E402
+import storage  # noqa: E402
+from ml.compiled_forest import CompiledForest, file_sha256  # noqa: E402
+from ml.inference import MLPredictor  # noqa: E402
+from ml.preprocessing import harmonize_frame  # noqa: E402
+from ml.schema import CIC_COLUMN_ALIASES  # noqa: E402
+from ml.train_model import build_inference_artifact, build_pipeline  # noqa: E402
+
+WORK_DIR = Path(tempfile.mkdtemp())
+# Importing server opens the reports database; keep it away from the real one.
+storage.DB_PATH = WORK_DIR / "reports.db"
+datasets_storage.UPLOAD_DIR = WORK_DIR / "uploads"
+datasets_storage.META_PATH = WORK_DIR / "datasets.json"
+
+import server  # noqa: E402
+from feature_cache import open_feature_cache  # noqa: E402
+
+PREDICTION_FIELDS = ("label", "confidence", "stability_score", "triggered_indicators", "feature_snapshot")
+
+
+def _cic_csv(path: Path, rows: int, seed: int) -> Path:
+    """CIC-IDS2017 layout with the values that are easy to get subtly wrong."""
+    rng = random.Random(seed)
+    names = [aliases[0] for aliases in CIC_COLUMN_ALIASES.values()]
+    header = [" Source IP", " Destination IP"] + [
+        name if index % 4 == 0 else f" {name}" for index, name in enumerate(names)
+    ] + [" Label"]
+
+    def value(name: str) -> str:
+        if name == "Destination Port":
+            return str(rng.choice((22, 80, 443, 8080, rng.randrange(200_000))))
+        roll = rng.random()
+        if roll < 0.03:
+            return rng.choice(("", "Infinity", "NaN", "-1"))
+        if roll < 0.2:
+            return "0"
+        if roll < 0.5:
+            return str(rng.randrange(10**9))
+        return f"{rng.lognormvariate(6, 3):.1f}"
+
+    with open(path, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(header)
+        for index in range(rows):
+            writer.writerow(
+                [f"192.168.10.{index % 250}", "10.0.0.5"]
+                + [value(name) for name in names]
+                + [rng.choice(("BENIGN", "DDoS", "PortScan"))]
+            )
+    return path
+
+
+def _train(path: Path, trees: int, seed: int):
+    raw = pd.read_csv(path)
+    raw.columns = [column.strip() for column in raw.columns]
+    frame = harmonize_frame(raw, "cic_ids2017")
+    labels = (raw["Label"] != "BENIGN").astype(int)
+    pipeline = build_pipeline()
+    pipeline.set_params(model__n_estimators=trees, model__random_state=seed, model__n_jobs=1)
+    pipeline.fit(frame, labels)
+    return pipeline
+
+
+def _check(report: dict, name: str, passed: bool, **details):
+    report["checks"][name] = {"passed": bool(passed), **details}
+
+
+def _predictions(results: list[dict]) -> list[dict]:
+    return [{field: result["prediction"][field] for field in PREDICTION_FIELDS} for result in results]
+
+
+def _mismatches(expected: list, actual: list) -> int:
+    if len(expected) != len(actual):
+        return max(len(expected), len(actual))
+    return sum(left != right for left, right in zip(expected, actual))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that all inference paths agree on a synthetic CIC-shaped file.")
+    parser.add_argument("--rows", type=int, default=400, help="Rows in the scored CSV")
+    parser.add_argument("--train-rows", type=int, default=2000, help="Rows used to train the check pipeline")
+    parser.add_argument("--trees", type=int, default=24, help="Trees in the check forest")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for the data and the forest")
+    args = parser.parse_args()
+
+    datasets_storage.UPLOAD_DIR.mkdir(parents=True)
+    pipeline = _train(_cic_csv(WORK_DIR / "train.csv", args.train_rows, args.seed), args.trees, args.seed)
+    model_path = WORK_DIR / "model.joblib"
+    dump(pipeline, model_path)
+    artifact_path = WORK_DIR / "inference.joblib"
+    dump(build_inference_artifact(pipeline, file_sha256(model_path)), artifact_path)
+
+    source = _cic_csv(datasets_storage.UPLOAD_DIR / "check.csv", args.rows, args.seed + 1)
+    raw = pd.read_csv(source)
+    raw.columns = [column.strip() for column in raw.columns]
+    matrix = harmonize_frame(raw, "cic_ids2017")
+    report = {"config": vars(args), "checks": {}}
+
+    compiled = CompiledForest.from_pipeline(pipeline)
+    comparison = compiled.verify_against(pipeline, matrix)
+    _check(report, "compiled_vs_sklearn", comparison["bitwise_equal"], mismatched_rows=comparison["mismatched_rows"])
+    folded = CompiledForest.from_pipeline(pipeline, fold_scaler=True)
+    comparison = folded.verify_against(pipeline, matrix)
+    _check(
+        report,
+        "folded_vs_sklearn",
+        comparison["label_agreement"] == 1.0,
+        label_agreement=comparison["label_agreement"],
+        max_abs_difference=comparison["max_abs_difference"],
+    )
+
+    missing = WORK_DIR / "missing.joblib"
+    predictors = {
+        "sklearn": MLPredictor(model_path, engine="sklearn", inference_model_path=missing),
+        "compiled": MLPredictor(model_path, engine="compiled", inference_model_path=missing),
+        "compiled-artifact": MLPredictor(model_path, engine="compiled", inference_model_path=artifact_path),
+    }
+    rows = matrix.to_dict(orient="records")
+    outputs = {}
+    for engine, predictor in predictors.items():
+        if predictor.engine != engine:
+            _check(report, f"{engine}_engine_loaded", False, loaded=predictor.engine)
+            continue
+        outputs[engine] = [asdict(output) for output in predictor.predict_batch_from_features(rows)]
+        from_matrix = [asdict(output) for output in predictor.predict_batch_from_matrix(matrix.to_numpy())]
+        _check(report, f"{engine}_matrix_vs_rows", outputs[engine] == from_matrix, mismatched_rows=_mismatches(outputs[engine], from_matrix))
+    if "sklearn" in outputs and "compiled" in outputs:
+        _check(
+            report,
+            "predictor_compiled_vs_sklearn",
+            outputs["compiled"] == outputs["sklearn"],
+            mismatched_rows=_mismatches(outputs["sklearn"], outputs["compiled"]),
+        )
+    if "sklearn" in outputs and "compiled-artifact" in outputs:
+        labels = [[output["label"] for output in outputs[engine]] for engine in ("sklearn", "compiled-artifact")]
+        _check(report, "predictor_artifact_vs_sklearn_labels", labels[0] == labels[1], mismatched_rows=_mismatches(*labels))
+
+    server.predictor = predictors["compiled"]
+    client = server.app.test_client()
+    response = client.post(
+        "/api/v1/analyze/csv",
+        data={"file": (io.BytesIO(source.read_bytes()), source.name), "limit": "0"},
+        content_type="multipart/form-data",
+    )
+    row_path = _predictions(response.get_json()["results"])
+    chunk_path = _predictions(
+        [result for batch in server._iter_dataset_analysis_batches(source, source.name, 0) for result in batch]
+    )
+    server._build_dataset_feature_cache(source)
+    cache = open_feature_cache(source)
+    cache_path = (
+        _predictions([result for batch in server._iter_dataset_analysis_batches(source, source.name, 0) for result in batch])
+        if cache is not None
+        else []
+    )
+    _check(report, "dataset_rows", len(row_path) == args.rows, rows=len(row_path))
+    _check(report, "chunk_vs_row_path", chunk_path == row_path, mismatched_rows=_mismatches(row_path, chunk_path))
+    _check(report, "cache_built", cache is not None)
+    _check(report, "cache_vs_chunk_path", cache_path == chunk_path, mismatched_rows=_mismatches(chunk_path, cache_path))
+
+    report["passed"] = all(check["passed"] for check in report["checks"].values())
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
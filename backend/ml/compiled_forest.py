@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import load
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from .schema import CANONICAL_FEATURES, MODEL_PATH
+
+# Rows walked through the ensemble at once.  Small chunks keep the feature
+# block and the (trees, rows) index arrays cache-resident.
+WALK_CHUNK_ROWS = 256
+
+# Format tag written into persisted inference artifacts and model_info.json.
+INFERENCE_ARTIFACT_FORMAT = "compiled-forest-v1"
+
+
+class CompiledForest:
+    """Array-backed copy of a fitted imputer → scaler → RandomForest pipeline.
+
+    Every tree is flattened into shared contiguous arrays (split feature and
+    interleaved left/right child indices as int32, split thresholds as
+    float32) and all trees are
+    walked together, vectorized over the batch.  Preprocessing and probability
+    accumulation follow scikit-learn's arithmetic step for step, so the output
+    matches ``pipeline.predict_proba`` bit for bit (see ``verify_against``).
+
+    With ``fold_scaler=True`` the scaler is folded into float64 split
+    thresholds in raw feature units instead, leaving only the imputer's fill
+    vector as preprocessing.  That form is what ``train_model`` persists as
+    the inference artifact; it agrees with the pipeline up to float32
+    rounding at split boundaries rather than bit for bit.
+    """
+
+    def __init__(
+        self,
+        fill_values: np.ndarray | None,
+        center: np.ndarray | None,
+        scale: np.ndarray | None,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        children: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        classes: np.ndarray,
+        metadata: dict | None = None,
+    ):
+        self.fill_values = fill_values
+        self.center = center
+        self.scale = scale
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes = classes
+        self.metadata = dict(metadata or {})
+        self.n_features = len(fill_values) if fill_values is not None else None
+
+    @property
+    def n_trees(self) -> int:
+        return int(len(self.roots))
+
+    @property
+    def n_nodes(self) -> int:
+        return int(len(self.feature))
+
+    @property
+    def folded(self) -> bool:
+        return self.threshold.dtype == np.float64
+
+    # ------------------------------------------------------------------
+    # Compilation
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_pipeline(cls, pipeline, fold_scaler: bool = False) -> "CompiledForest":
+        """Compile a fitted pipeline (or bare forest).
+
+        Raises ValueError for any configuration whose arithmetic this engine
+        does not reproduce exactly, so callers can fall back to scikit-learn.
+        """
+        steps = list(pipeline.steps) if isinstance(pipeline, Pipeline) else [(None, pipeline)]
+        *preprocessors, (_, forest) = steps
+        if not isinstance(forest, RandomForestClassifier):
+            raise ValueError("Final estimator must be a RandomForestClassifier")
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise ValueError("Multi-output forests are not supported")
+
+        fill_values = center = scale = None
+        for _, step in preprocessors:
+            if isinstance(step, SimpleImputer) and fill_values is None and center is None:
+                statistics = np.asarray(step.statistics_, dtype=np.float64)
+                if np.isnan(statistics).any() or not _is_nan_marker(step.missing_values):
+                    raise ValueError("Imputer drops empty features or uses a custom missing marker")
+                if getattr(step, "add_indicator", False):
+                    raise ValueError("Imputer missing-indicator columns are not supported")
+                fill_values = statistics
+            elif isinstance(step, StandardScaler) and center is None:
+                center = np.asarray(step.mean_, dtype=np.float64) if step.with_mean else None
+                scale = np.asarray(step.scale_, dtype=np.float64) if step.with_std else None
+                if center is None and scale is None:
+                    center = np.zeros(step.n_features_in_, dtype=np.float64)
+            else:
+                raise ValueError(f"Unsupported preprocessing step: {type(step).__name__}")
+
+        fold = fold_scaler and (center is not None or scale is not None)
+        if fold:
+            n_inputs = int(forest.n_features_in_)
+            fold_center = center if center is not None else np.zeros(n_inputs, dtype=np.float64)
+            fold_scale = scale if scale is not None else np.ones(n_inputs, dtype=np.float64)
+            center = scale = None
+
+        n_classes = int(forest.n_classes_)
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            count = int(tree.node_count)
+            is_leaf = tree.children_left == -1
+            local = np.arange(count)
+
+            node_value = np.asarray(tree.value[:, 0, :n_classes], dtype=np.float64)
+            totals = node_value.sum(axis=1)
+            if not np.allclose(totals[is_leaf], 1.0):
+                # Older scikit-learn stores per-class weights rather than fractions.
+                totals[totals == 0.0] = 1.0
+                node_value = node_value / totals[:, None]
+
+            split_feature = np.where(is_leaf, 0, tree.feature).astype(np.int32)
+            features.append(split_feature)
+            if fold:
+                # (x - center) / scale <= t  <=>  x <= t * scale + center, since scale > 0.
+                raw = tree.threshold * fold_scale[split_feature] + fold_center[split_feature]
+                thresholds.append(np.where(is_leaf, np.inf, raw))
+            else:
+                thresholds.append(
+                    np.where(is_leaf, np.float32(np.inf), _float32_floor(tree.threshold))
+                )
+            # Leaves point back to themselves so a fixed number of steps lands
+            # every row; children[2 * node + go_right] is the next node.
+            pairs = np.empty((count, 2), dtype=np.int64)
+            pairs[:, 0] = np.where(is_leaf, local, tree.children_left) + offset
+            pairs[:, 1] = np.where(is_leaf, local, tree.children_right) + offset
+            children.append(pairs.ravel())
+            values.append(node_value)
+            roots.append(offset)
+            offset += count
+            max_depth = max(max_depth, int(tree.max_depth))
+
+        if 2 * offset >= np.iinfo(np.int32).max:
+            raise ValueError("Forest is too large for int32 node indices")
+
+        return cls(
+            fill_values=fill_values,
+            center=center,
+            scale=scale,
+            feature=np.ascontiguousarray(np.concatenate(features)),
+            threshold=np.ascontiguousarray(
+                np.concatenate(thresholds).astype(np.float64 if fold else np.float32)
+            ),
+            children=np.ascontiguousarray(np.concatenate(children).astype(np.int32)),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            classes=np.asarray(forest.classes_),
+        )
+
+    # ------------------------------------------------------------------
+    # Inference
+    # ------------------------------------------------------------------
+
+    def transform(self, matrix: np.ndarray) -> np.ndarray:
+        """Apply imputation and scaling, returning the matrix the trees compare.
+
+        That is float32 for a plain compiled pipeline, as in scikit-learn, and
+        float64 when the scaler has been folded into the thresholds.
+        """
+        matrix = np.array(matrix, dtype=np.float64)
+        if matrix.ndim != 2:
+            raise ValueError("Expected a 2-D feature matrix")
+        if np.isinf(matrix).any():
+            raise ValueError("Input contains infinity")
+        if self.fill_values is not None:
+            if matrix.shape[1] != len(self.fill_values):
+                raise ValueError(
+                    f"Expected {len(self.fill_values)} features, got {matrix.shape[1]}"
+                )
+            missing = np.isnan(matrix)
+            if missing.any():
+                matrix[missing] = np.broadcast_to(self.fill_values, matrix.shape)[missing]
+        if self.center is not None:
+            matrix -= self.center
+        if self.scale is not None:
+            matrix /= self.scale
+        with np.errstate(over="ignore"):
+            transformed = matrix.astype(self.threshold.dtype, copy=False)
+        if not np.isfinite(transformed).all():
+            raise ValueError("Input contains NaN, infinity or a value too large for float32")
+        return transformed
+
+    def predict_proba(self, matrix: np.ndarray, n_threads: int = 1) -> np.ndarray:
+        """Class probabilities for ``matrix``; chunks are spread over ``n_threads`` threads."""
+        transformed = self.transform(matrix)
+        rows = transformed.shape[0]
+        output = np.empty((rows, self.value.shape[1]), dtype=np.float64)
+        starts = range(0, rows, WALK_CHUNK_ROWS)
+
+        def fill(start: int) -> None:
+            chunk = transformed[start:start + WALK_CHUNK_ROWS]
+            output[start:start + len(chunk)] = self._predict_chunk(chunk)
+
+        if n_threads > 1 and len(starts) > 1:
+            with ThreadPoolExecutor(max_workers=min(n_threads, len(starts))) as executor:
+                list(executor.map(fill, starts))
+        else:
+            for start in starts:
+                fill(start)
+        return output
+
+    def _predict_chunk(self, chunk: np.ndarray) -> np.ndarray:
+        rows, width = chunk.shape
+        flat = np.ascontiguousarray(chunk).ravel()
+        row_base = (np.arange(rows, dtype=np.int32) * width)[None, :]
+        node = np.repeat(self.roots[:, None], rows, axis=1)
+        for _ in range(self.max_depth):
+            # Inputs are finite, so "not (x <= t)" is exactly "x > t".
+            values = np.take(flat, row_base + np.take(self.feature, node))
+            go_right = values > np.take(self.threshold, node)
+            node = np.take(self.children, (node << 1) + go_right)
+
+        # Sum per-tree probabilities sequentially in tree order, as the forest does.
+        leaf_values = self.value[node]
+        return np.cumsum(leaf_values, axis=0)[-1] / self.n_trees
+
+    # ------------------------------------------------------------------
+    # Verification
+    # ------------------------------------------------------------------
+
+    def verify_against(self, pipeline, frame: pd.DataFrame) -> dict:
+        """Compare against ``pipeline.predict_proba`` on ``frame``.
+
+        The forest is scored with ``n_jobs=1`` for the comparison because
+        parallel accumulation makes scikit-learn's own last bit order-dependent.
+        """
+        forest = pipeline.steps[-1][1] if isinstance(pipeline, Pipeline) else pipeline
+        previous_jobs = forest.n_jobs
+        forest.n_jobs = 1
+        try:
+            expected = pipeline.predict_proba(frame)
+        finally:
+            forest.n_jobs = previous_jobs
+        actual = self.predict_proba(frame.to_numpy(dtype=np.float64))
+        return {
+            "rows": int(len(frame)),
+            "bitwise_equal": bool(np.array_equal(expected, actual)),
+            "label_agreement": (
+                float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1))) if len(frame) else 1.0
+            ),
+            "mismatched_rows": int((expected != actual).any(axis=1).sum()),
+            "max_abs_difference": float(np.max(np.abs(expected - actual))) if len(frame) else 0.0,
+        }
+
+
+def _is_nan_marker(value) -> bool:
+    try:
+        return bool(np.isnan(value))
+    except TypeError:
+        return False
+
+
+def _float32_floor(values: np.ndarray) -> np.ndarray:
+    """Largest float32 not above each float64 threshold.
+
+    For any float32 ``x``, ``x <= t`` holds exactly when ``x <= floor32(t)``,
+    so the float32 threshold array makes the same split decisions as the
+    float64 thresholds scikit-learn stores.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(over="ignore"):
+        rounded = values.astype(np.float32)
+    too_high = rounded.astype(np.float64) > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+def file_sha256(path: Path) -> str:
+    """Hex SHA-256 of a file, read in 1 MiB blocks.
+
+    Stored in the inference artifact's metadata for the pipeline it was built
+    from, so a retrained or replaced pipeline is not shadowed by a leftover
+    artifact.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def probe_frame(rows: int = 256, seed: int = 0) -> pd.DataFrame:
+    """Deterministic synthetic flows covering zeros, small and heavy-tailed values."""
+    rng = np.random.default_rng(seed)
+    matrix = rng.lognormal(mean=2.0, sigma=3.0, size=(rows, len(CANONICAL_FEATURES)))
+    matrix[rng.random(matrix.shape) < 0.4] = 0.0
+    port_column = CANONICAL_FEATURES.index("destination_port")
+    matrix[:, port_column] = rng.choice([22, 53, 80, 443, 445, 3389, 8080], size=rows)
+    return pd.DataFrame(matrix, columns=CANONICAL_FEATURES)
+
+
+def latency_report(pipeline, compiled: CompiledForest, frame: pd.DataFrame, repeats: int = 20) -> dict:
+    """Mean per-call latency in milliseconds for one row and for the whole frame."""
+    single = frame.iloc[[0]]
+    single_matrix = single.to_numpy(dtype=np.float64)
+    batch_matrix = frame.to_numpy(dtype=np.float64)
+    calls = {
+        "sklearn_single_ms": lambda: pipeline.predict_proba(single),
+        "compiled_single_ms": lambda: compiled.predict_proba(single_matrix),
+        "sklearn_batch_ms": lambda: pipeline.predict_proba(frame),
+        "compiled_batch_ms": lambda: compiled.predict_proba(batch_matrix),
+    }
+    timings: dict = {"batch_rows": int(len(frame))}
+    for name, call in calls.items():
+        call()
+        started = time.perf_counter()
+        for _ in range(repeats):
+            call()
+        timings[name] = round((time.perf_counter() - started) / repeats * 1000, 3)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile the persisted forest and check it against scikit-learn."
+    )
+    parser.add_argument("--model", default=str(MODEL_PATH), help="Path to the joblib pipeline")
+    parser.add_argument(
+        "--csv",
+        required=False,
+        help="Harmonized 77-feature CSV used as the test set (defaults to synthetic probe rows)",
+    )
+    parser.add_argument("--rows", type=int, default=2000, help="Synthetic probe rows when --csv is absent")
+    args = parser.parse_args()
+
+    pipeline = load(Path(args.model))
+    compiled = CompiledForest.from_pipeline(pipeline)
+    if args.csv:
+        frame = pd.read_csv(args.csv)[CANONICAL_FEATURES].astype(np.float64)
+    else:
+        frame = probe_frame(args.rows)
+
+    report = compiled.verify_against(pipeline, frame)
+    report.update({"trees": compiled.n_trees, "nodes": compiled.n_nodes, "max_depth": compiled.max_depth})
+    report["latency"] = latency_report(pipeline, compiled, frame.iloc[:1000])
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import json
+import math
+import os
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
@@ -9,7 +11,16 @@ import numpy as np
 import pandas as pd
 from joblib import load
 
-from .schema import CANONICAL_FEATURES, METRICS_PATH, MODEL_INFO_PATH, MODEL_PATH
+from .compiled_forest import INFERENCE_ARTIFACT_FORMAT, CompiledForest, file_sha256, probe_frame
+from .parallelism import ParallelismPolicy, clear_baked_n_jobs, sklearn_predict_proba
+from .prediction_cache import PredictionCache
+from .schema import (
+    CANONICAL_FEATURES,
+    INFERENCE_MODEL_PATH,
+    METRICS_PATH,
+    MODEL_INFO_PATH,
+    MODEL_PATH,
+)
 
 # ---------------------------------------------------------------------------
 # Sentinel set for fast detection of canonical-feature payloads.
@@ -17,6 +28,10 @@ from .schema import CANONICAL_FEATURES, METRICS_PATH, MODEL_INFO_PATH, MODEL_PAT
 # ---------------------------------------------------------------------------
 _CANONICAL_KEY_SET: frozenset[str] = frozenset(CANONICAL_FEATURES)
 
+# Upper bound of destination_port, as applied by ml.preprocessing.harmonize_frame.
+_MAX_PORT = 65535.0
+_PORT_INDEX = CANONICAL_FEATURES.index("destination_port")
+
 # Legacy-field → canonical-feature mapping used by the backward-compat layer.
 _LEGACY_TO_CANONICAL: dict[str, str] = {
     "destination_port":    "destination_port",
@@ -31,6 +46,83 @@ _LEGACY_TO_CANONICAL: dict[str, str] = {
 }
 
 
+# ---------------------------------------------------------------------------
+# Stability scoring configuration.
+#   off  — no perturbation passes; the heuristic stability estimate is used.
+#   fast — one perturbed variant per event (the multiplier furthest from 1.0).
+#   full — one perturbed variant per event per configured multiplier.
+# ---------------------------------------------------------------------------
+STABILITY_MODES: tuple[str, ...] = ("off", "fast", "full")
+
+# Inference engines:
+#   compiled — the slim inference artifact written by train_model when it is
+#              present and matches the schema; otherwise a CompiledForest built
+#              from the pipeline and verified bit-for-bit against it at load
+#              time, falling back to sklearn if that fails.
+#   sklearn  — the persisted pipeline's predict_proba.
+INFERENCE_ENGINES: tuple[str, ...] = ("compiled", "sklearn")
+
+DEFAULT_STABILITY_MULTIPLIERS: tuple[float, ...] = (0.95, 1.05)
+
+# The five most predictive flow-rate features.
+DEFAULT_STABILITY_KEYS: tuple[str, ...] = (
+    "flow_bytes_per_s",
+    "flow_packets_per_s",
+    "flow_duration",
+    "total_fwd_packets",
+    "total_bwd_packets",
+)
+
+
+@dataclass(frozen=True)
+class StabilityConfig:
+    mode: str = "full"
+    multipliers: tuple[float, ...] = DEFAULT_STABILITY_MULTIPLIERS
+    perturb_keys: tuple[str, ...] = DEFAULT_STABILITY_KEYS
+
+    def __post_init__(self) -> None:
+        if self.mode not in STABILITY_MODES:
+            raise ValueError(
+                f"Unknown stability mode {self.mode!r}; expected one of {', '.join(STABILITY_MODES)}"
+            )
+        if not self.multipliers:
+            raise ValueError("At least one stability multiplier is required")
+        unknown = [key for key in self.perturb_keys if key not in _CANONICAL_KEY_SET]
+        if unknown:
+            raise ValueError(f"Unknown stability perturbation keys: {', '.join(unknown)}")
+
+    @classmethod
+    def from_env(cls) -> "StabilityConfig":
+        """Build the deployment-wide config from IDS_STABILITY_* environment variables."""
+        multipliers = os.environ.get("IDS_STABILITY_MULTIPLIERS")
+        keys = os.environ.get("IDS_STABILITY_KEYS")
+        return cls(
+            mode=os.environ.get("IDS_STABILITY_MODE", "full").strip().lower(),
+            multipliers=(
+                tuple(float(item) for item in multipliers.split(",") if item.strip())
+                if multipliers
+                else DEFAULT_STABILITY_MULTIPLIERS
+            ),
+            perturb_keys=(
+                tuple(item.strip() for item in keys.split(",") if item.strip())
+                if keys
+                else DEFAULT_STABILITY_KEYS
+            ),
+        )
+
+    def with_mode(self, mode: str | None) -> "StabilityConfig":
+        if mode is None or mode == self.mode:
+            return self
+        return StabilityConfig(mode=mode, multipliers=self.multipliers, perturb_keys=self.perturb_keys)
+
+    def active_multipliers(self) -> tuple[float, ...]:
+        if self.mode == "off":
+            return ()
+        if self.mode == "fast":
+            return (max(self.multipliers, key=lambda value: abs(value - 1.0)),)
+        return self.multipliers
+
+
 def _safe_float(value: Any, default: float = 0.0) -> float:
     try:
         return float(value)
@@ -58,22 +150,101 @@ class PredictionOutput:
 
 
 class MLPredictor:
-    def __init__(self, model_path: str | Path = MODEL_PATH):
+    def __init__(
+        self,
+        model_path: str | Path = MODEL_PATH,
+        stability: StabilityConfig | None = None,
+        engine: str | None = None,
+        inference_model_path: str | Path = INFERENCE_MODEL_PATH,
+        parallelism: ParallelismPolicy | None = None,
+        cache: PredictionCache | None = None,
+    ):
         self.model_path = Path(model_path)
+        self.inference_model_path = Path(inference_model_path)
         self.pipeline = None
+        self.compiled: CompiledForest | None = None
+        self.stability = stability or StabilityConfig.from_env()
+        self.parallelism = parallelism or ParallelismPolicy.from_env()
+        self.cache = cache or PredictionCache.from_env()
+        self.requested_engine = (engine or os.environ.get("IDS_INFERENCE_ENGINE", "compiled")).strip().lower()
+        if self.requested_engine not in INFERENCE_ENGINES:
+            raise ValueError(
+                f"Unknown inference engine {self.requested_engine!r}; "
+                f"expected one of {', '.join(INFERENCE_ENGINES)}"
+            )
+        self.engine = "heuristic"
         self.model_info = self._load_json(MODEL_INFO_PATH)
         self.metrics = self._load_json(METRICS_PATH)
         self.available = False
         self.model_version = "heuristic-fallback"
 
+        if self.requested_engine == "compiled":
+            self.compiled = self._load_inference_artifact(self.inference_model_path)
+            if self.compiled is not None:
+                self.available = True
+                self.model_version = self.compiled.metadata["model_version"]
+                self.engine = "compiled-artifact"
+                return
+
         if self.model_path.exists():
             try:
                 self.pipeline = load(self.model_path)
+                # The artifact is trained with n_jobs=-1; thread use is decided per call instead.
+                clear_baked_n_jobs(self.pipeline)
                 self.available = True
                 self.model_version = self.model_info.get("model_version", "rf-cic-77f-v2")
+                self.engine = "sklearn"
             except Exception:
                 pass
 
+        if self.pipeline is not None and self.requested_engine == "compiled":
+            self.compiled = self._compile_pipeline(self.pipeline)
+            if self.compiled is not None:
+                self.engine = "compiled"
+
+    def _load_inference_artifact(self, path: Path) -> CompiledForest | None:
+        """Load the slim artifact written by train_model if it matches this schema.
+
+        The artifact must also have been built from the pipeline at
+        ``model_path`` when that file exists: a retrained or replaced pipeline
+        next to a leftover artifact is loaded (and compiled) instead.
+        """
+        if not path.exists():
+            return None
+        try:
+            artifact = load(path)
+        except Exception:
+            return None
+        if not isinstance(artifact, CompiledForest):
+            return None
+        metadata = artifact.metadata
+        expected_version = self.model_info.get("model_version")
+        if (
+            metadata.get("format") != INFERENCE_ARTIFACT_FORMAT
+            or metadata.get("features") != CANONICAL_FEATURES
+            or not metadata.get("model_version")
+            or (expected_version and metadata["model_version"] != expected_version)
+        ):
+            return None
+        if self.model_path.exists():
+            try:
+                pipeline_sha256 = file_sha256(self.model_path)
+            except OSError:
+                return None
+            if metadata.get("pipeline_sha256") != pipeline_sha256:
+                return None
+        return artifact
+
+    @staticmethod
+    def _compile_pipeline(pipeline) -> CompiledForest | None:
+        """Compile the pipeline and keep it only if it reproduces sklearn exactly."""
+        try:
+            compiled = CompiledForest.from_pipeline(pipeline)
+            check = compiled.verify_against(pipeline, probe_frame(64))
+        except Exception:
+            return None
+        return compiled if check["bitwise_equal"] else None
+
     @staticmethod
     def _load_json(path: Path) -> dict[str, Any]:
         if not path.exists():
@@ -91,16 +262,22 @@ class MLPredictor:
         self,
         features: dict[str, Any],
         context: dict[str, Any] | None = None,
+        stability_mode: str | None = None,
     ) -> PredictionOutput:
         """Primary inference path.
 
         ``features`` should be a dict whose keys are canonical 77-feature names.
-        Any missing keys default to 0.0 after normalization.
+        Any missing keys default to 0.0 after normalization.  ``stability_mode``
+        overrides the deployment-wide stability mode for this call only.
         """
         normalized = self._normalize_features(features)
-        return self._run_inference(normalized, context or {})
+        return self._run_inference(normalized, context or {}, stability_mode)
 
-    def predict_from_event(self, event: dict[str, Any]) -> PredictionOutput:
+    def predict_from_event(
+        self,
+        event: dict[str, Any],
+        stability_mode: str | None = None,
+    ) -> PredictionOutput:
         """Dispatch to the appropriate inference path.
 
         If the event already contains canonical 77-feature keys (e.g. flow_duration,
@@ -109,20 +286,95 @@ class MLPredictor:
         via _event_to_features() — a degraded compatibility path where the ~69
         unmapped features default to 0.0.
         """
-        if _CANONICAL_KEY_SET.intersection(event):
-            return self.predict_from_features(event, context=event)
-        # [DEGRADED COMPAT] Legacy event fields → 77-feature schema.
-        return self.predict_from_features(self._event_to_features(event), context=event)
+        return self.predict_from_features(
+            self._features_from_event(event), context=event, stability_mode=stability_mode
+        )
+
+    def predict_batch_from_features(
+        self,
+        features_batch: list[dict[str, Any]],
+        contexts: list[dict[str, Any]] | None = None,
+        stability_mode: str | None = None,
+    ) -> list[PredictionOutput]:
+        """Batch counterpart of predict_from_features().
+
+        All rows are scored with a single ``predict_proba`` call over an
+        (N, 77) matrix.  Outputs are returned in input order and are identical
+        to calling predict_from_features() once per row.
+        """
+        if contexts is None:
+            contexts = [{} for _ in features_batch]
+        if len(contexts) != len(features_batch):
+            raise ValueError("contexts must have the same length as features_batch")
+        normalized_batch = [self._normalize_features(features) for features in features_batch]
+        return self._run_batch_inference(
+            normalized_batch, [context or {} for context in contexts], stability_mode
+        )
+
+    def predict_batch_from_events(
+        self,
+        events: list[dict[str, Any]],
+        stability_mode: str | None = None,
+    ) -> list[PredictionOutput]:
+        """Batch counterpart of predict_from_event().
+
+        Each event is dispatched to the canonical or legacy path individually,
+        so canonical and legacy events may be mixed within one batch.
+        """
+        return self.predict_batch_from_features(
+            [self._features_from_event(event) for event in events],
+            contexts=events,
+            stability_mode=stability_mode,
+        )
+
+    def predict_batch_from_matrix(
+        self,
+        matrix: np.ndarray,
+        contexts: list[dict[str, Any]] | None = None,
+        stability_mode: str | None = None,
+    ) -> list[PredictionOutput]:
+        """Batch inference over an (N, 77) matrix in CANONICAL_FEATURES order.
+
+        Meant for frames already mapped by ml.preprocessing.harmonize_frame:
+        the matrix is normalized as a whole (the same rules as
+        _normalize_features) instead of going through one feature dict per
+        row.  Outputs are identical to predict_batch_from_features() with the
+        same values.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64).reshape(-1, len(CANONICAL_FEATURES))
+        matrix = np.where(np.isfinite(matrix) & (matrix > 0.0), matrix, 0.0)
+        np.minimum(matrix[:, _PORT_INDEX], _MAX_PORT, out=matrix[:, _PORT_INDEX])
+        if contexts is None:
+            contexts = [{} for _ in range(len(matrix))]
+        if len(contexts) != len(matrix):
+            raise ValueError("contexts must have the same length as matrix")
+        normalized_batch = [dict(zip(CANONICAL_FEATURES, row)) for row in matrix.tolist()]
+        return self._run_batch_inference(
+            normalized_batch, [context or {} for context in contexts], stability_mode, matrix
+        )
 
     # ------------------------------------------------------------------
     # Feature normalization
     # ------------------------------------------------------------------
 
+    def _features_from_event(self, event: dict[str, Any]) -> dict[str, Any]:
+        if _CANONICAL_KEY_SET.intersection(event):
+            return event
+        # [DEGRADED COMPAT] Legacy event fields → 77-feature schema.
+        return self._event_to_features(event)
+
     def _normalize_features(self, features: dict[str, Any]) -> dict[str, float]:
-        """Return a dict with exactly the 77 canonical features, all non-negative floats."""
+        """Return a dict with exactly the 77 canonical features, all non-negative floats.
+
+        Follows ml.preprocessing.harmonize_frame, so every endpoint scores a
+        row the same way: missing, NaN and infinite values become 0.0,
+        negatives are raised to 0.0 and destination_port is capped at 65535.
+        """
         normalized: dict[str, float] = {}
         for feat in CANONICAL_FEATURES:
-            normalized[feat] = max(_safe_float(features.get(feat)), 0.0)
+            value = _safe_float(features.get(feat))
+            normalized[feat] = max(value, 0.0) if math.isfinite(value) else 0.0
+        normalized["destination_port"] = min(normalized["destination_port"], _MAX_PORT)
         return normalized
 
     def _event_to_features(self, event: dict[str, Any]) -> dict[str, Any]:
@@ -157,21 +409,105 @@ class MLPredictor:
         self,
         normalized: dict[str, float],
         context: dict[str, Any],
+        stability_mode: str | None = None,
     ) -> PredictionOutput:
-        if self.available and self.pipeline is not None:
+        return self._run_batch_inference([normalized], [context], stability_mode)[0]
+
+    def _run_batch_inference(
+        self,
+        normalized_batch: list[dict[str, float]],
+        contexts: list[dict[str, Any]],
+        stability_mode: str | None = None,
+        matrix: np.ndarray | None = None,
+    ) -> list[PredictionOutput]:
+        stability_config = self.stability.with_mode(stability_mode)
+        if not normalized_batch:
+            return []
+        if matrix is None:
+            matrix = self._feature_matrix(normalized_batch)
+        if self.cache is None:
+            return self._score_batch(normalized_batch, contexts, matrix, stability_config)
+
+        keys = [
+            self.cache.key(row, context, stability_config)
+            for row, context in zip(matrix, contexts)
+        ]
+        outputs: list[PredictionOutput | None] = [
+            self.cache.get(key, self.model_version) for key in keys
+        ]
+        missing = [index for index, output in enumerate(outputs) if output is None]
+        if missing:
+            scored = self._score_batch(
+                [normalized_batch[index] for index in missing],
+                [contexts[index] for index in missing],
+                matrix[missing],
+                stability_config,
+            )
+            for index, output in zip(missing, scored):
+                outputs[index] = output
+                self.cache.put(keys[index], output)
+        return outputs
+
+    def _score_batch(
+        self,
+        normalized_batch: list[dict[str, float]],
+        contexts: list[dict[str, Any]],
+        matrix: np.ndarray,
+        stability_config: StabilityConfig,
+    ) -> list[PredictionOutput]:
+        attack_probabilities: list[float] | None = None
+        stabilities: list[float] | None = None
+        if self.available:
             try:
-                frame = pd.DataFrame([normalized], columns=CANONICAL_FEATURES)
-                probabilities = self.pipeline.predict_proba(frame)[0]
-                attack_probability = float(probabilities[1])
-                stability = self._stability_score(normalized)
+                baseline = self._predict_attack_proba(matrix)
+                attack_probabilities = [float(value) for value in baseline]
+                if stability_config.mode != "off":
+                    stabilities = self._stability_scores(matrix, baseline, stability_config)
             except Exception:
                 # Model schema mismatch (e.g. stale artifact) — fall through to heuristic.
+                attack_probabilities = None
+                stabilities = None
+
+        outputs: list[PredictionOutput] = []
+        for index, (normalized, context) in enumerate(zip(normalized_batch, contexts)):
+            if attack_probabilities is None:
                 attack_probability = self._heuristic_probability(normalized, context)
+            else:
+                attack_probability = attack_probabilities[index]
+            if stabilities is None:
                 stability = self._heuristic_stability(normalized, attack_probability)
-        else:
-            attack_probability = self._heuristic_probability(normalized, context)
-            stability = self._heuristic_stability(normalized, attack_probability)
+            else:
+                stability = stabilities[index]
+            outputs.append(self._build_output(normalized, context, attack_probability, stability))
+        return outputs
 
+    @staticmethod
+    def _feature_matrix(normalized_batch: list[dict[str, float]]) -> np.ndarray:
+        """Stack normalized feature dicts into an (N, 77) matrix in canonical order."""
+        return np.array(
+            [[normalized[feat] for feat in CANONICAL_FEATURES] for normalized in normalized_batch],
+            dtype=np.float64,
+        ).reshape(len(normalized_batch), len(CANONICAL_FEATURES))
+
+    def _predict_attack_proba(self, matrix: np.ndarray) -> np.ndarray:
+        """Attack-class probability for every row of an (N, 77) canonical matrix."""
+        with self.parallelism.reserve(len(matrix)) as threads:
+            if self.compiled is not None:
+                try:
+                    return self.compiled.predict_proba(matrix, n_threads=threads)[:, 1]
+                except Exception:
+                    if self.pipeline is None:
+                        raise
+            frame = pd.DataFrame(matrix, columns=CANONICAL_FEATURES)
+            return sklearn_predict_proba(self.pipeline, frame, threads)[:, 1]
+
+    def _build_output(
+        self,
+        normalized: dict[str, float],
+        context: dict[str, Any],
+        attack_probability: float,
+        stability: float,
+    ) -> PredictionOutput:
         confidence = attack_probability if attack_probability >= 0.5 else 1.0 - attack_probability
         label = "Attack" if attack_probability >= 0.5 else "Benign"
 
@@ -194,36 +530,34 @@ class MLPredictor:
     # Stability scoring
     # ------------------------------------------------------------------
 
-    def _stability_score(self, features: dict[str, float]) -> float:
-        """Perturb the five most predictive flow-rate features and measure variance."""
-        if self.pipeline is None:
-            return self._heuristic_stability(features, 0.5)
-
-        perturb_keys = [
-            "flow_bytes_per_s",
-            "flow_packets_per_s",
-            "flow_duration",
-            "total_fwd_packets",
-            "total_bwd_packets",
-        ]
-        frame = pd.DataFrame([features], columns=CANONICAL_FEATURES)
-        baseline = float(self.pipeline.predict_proba(frame)[0][1])
-
-        variants: list[float] = []
-        for multiplier in (0.95, 1.05):
-            variant = dict(features)
-            for key in perturb_keys:
-                variant[key] = variant[key] * multiplier
-            try:
-                vframe = pd.DataFrame([variant], columns=CANONICAL_FEATURES)
-                variants.append(float(self.pipeline.predict_proba(vframe)[0][1]))
-            except Exception:
-                pass
+    def _stability_scores(
+        self,
+        matrix: np.ndarray,
+        baseline: np.ndarray,
+        config: StabilityConfig,
+    ) -> list[float]:
+        """Perturb the configured flow-rate features and measure prediction spread.
+
+        Every variant of every row is stacked into one (N * V, 77) matrix and
+        scored with a single model call; ``baseline`` is the unperturbed
+        attack probability already computed for ``matrix``.
+        """
+        multipliers = config.active_multipliers()
+        rows = len(matrix)
+        columns = [CANONICAL_FEATURES.index(key) for key in config.perturb_keys]
+
+        stacked = np.tile(matrix, (len(multipliers), 1))
+        for position, multiplier in enumerate(multipliers):
+            block = stacked[position * rows:(position + 1) * rows]
+            block[:, columns] = block[:, columns] * multiplier
+
+        try:
+            variants = self._predict_attack_proba(stacked).reshape(len(multipliers), rows)
+        except Exception:
+            return [0.75] * rows
 
-        if not variants:
-            return 0.75
-        spread = np.std([baseline, *variants])
-        return float(max(0.05, min(0.99, 1.0 - (spread * 4.5))))
+        spread = np.std(np.vstack([baseline.reshape(1, rows), variants]), axis=0)
+        return [float(max(0.05, min(0.99, 1.0 - (value * 4.5)))) for value in spread]
 
     def _heuristic_probability(self, features: dict[str, float], context: dict[str, Any]) -> float:
         score = 0.16
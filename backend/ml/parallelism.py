@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+from joblib import cpu_count, load, parallel_config
+from sklearn.pipeline import Pipeline
+
+from .compiled_forest import CompiledForest, probe_frame
+from .schema import MODEL_PATH
+
+# Batch sizes and thread counts swept by the crossover benchmark.
+BENCHMARK_ROWS: tuple[int, ...] = (1, 8, 32, 128, 256, 512, 1024, 4096)
+BENCHMARK_THREADS: tuple[int, ...] = (1, 2, 4, 8)
+
+
+@dataclass
+class ParallelismPolicy:
+    """Inference-time thread policy shared by every request in the process.
+
+    Batches of at most ``serial_max_rows`` rows run on the calling thread.
+    Larger batches get one thread per ``rows_per_thread`` rows, bounded by
+    ``max_threads``.  ``max_threads`` is also a process-wide budget: threads
+    are reserved from it for the duration of each call, so concurrent Flask
+    requests never run more inference threads than the cap between them.
+    """
+
+    serial_max_rows: int = 256
+    rows_per_thread: int = 1024
+    max_threads: int = field(default_factory=lambda: min(cpu_count(), 8))
+
+    def __post_init__(self) -> None:
+        if self.max_threads < 1:
+            raise ValueError("max_threads must be at least 1")
+        if self.rows_per_thread < 1:
+            raise ValueError("rows_per_thread must be at least 1")
+        self._budget = threading.BoundedSemaphore(self.max_threads)
+
+    @classmethod
+    def from_env(cls) -> "ParallelismPolicy":
+        """Build the policy from IDS_INFERENCE_* environment variables."""
+        defaults = cls()
+        environ = os.environ
+        return cls(
+            serial_max_rows=int(environ.get("IDS_INFERENCE_SERIAL_MAX_ROWS", defaults.serial_max_rows)),
+            rows_per_thread=int(environ.get("IDS_INFERENCE_ROWS_PER_THREAD", defaults.rows_per_thread)),
+            max_threads=int(environ.get("IDS_INFERENCE_MAX_THREADS", defaults.max_threads)),
+        )
+
+    def threads_for(self, rows: int) -> int:
+        if rows <= self.serial_max_rows:
+            return 1
+        return max(1, min(self.max_threads, math.ceil(rows / self.rows_per_thread)))
+
+    @contextmanager
+    def reserve(self, rows: int) -> Iterator[int]:
+        """Reserve threads for scoring ``rows`` rows and yield how many were granted.
+
+        One thread is always granted (waiting if the budget is exhausted);
+        extra threads are only taken if they are free right now.
+        """
+        wanted = self.threads_for(rows)
+        self._budget.acquire()
+        granted = 1
+        while granted < wanted and self._budget.acquire(blocking=False):
+            granted += 1
+        try:
+            yield granted
+        finally:
+            for _ in range(granted):
+                self._budget.release()
+
+
+def clear_baked_n_jobs(pipeline) -> None:
+    """Drop the persisted ``n_jobs`` so the parallel_config set per call applies."""
+    forest = pipeline.steps[-1][1] if isinstance(pipeline, Pipeline) else pipeline
+    if hasattr(forest, "n_jobs"):
+        forest.n_jobs = None
+
+
+def sklearn_predict_proba(pipeline, frame, threads: int) -> np.ndarray:
+    with parallel_config(backend="threading", n_jobs=threads):
+        return pipeline.predict_proba(frame)
+
+
+def _time_call(call, repeats: int) -> float:
+    call()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        call()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def crossover_benchmark(pipeline, compiled: CompiledForest | None, repeats: int = 5) -> dict:
+    """Per-call latency (ms) by batch size and thread count for each engine.
+
+    ``crossover_rows`` is the smallest batch size at which some multi-threaded
+    run is at least 10% faster than the serial one; it is a starting point
+    for serial_max_rows.
+    """
+    clear_baked_n_jobs(pipeline)
+    frame = probe_frame(max(BENCHMARK_ROWS))
+    engines = {"sklearn": lambda sample, threads: sklearn_predict_proba(pipeline, sample, threads)}
+    if compiled is not None:
+        engines["compiled"] = lambda sample, threads: compiled.predict_proba(
+            sample.to_numpy(dtype=np.float64), n_threads=threads
+        )
+
+    report: dict = {"cpu_count": cpu_count(), "engines": {}}
+    for name, predict in engines.items():
+        timings = {}
+        crossover = None
+        for rows in BENCHMARK_ROWS:
+            sample = frame.iloc[:rows]
+            row_timings = {
+                str(threads): round(_time_call(lambda: predict(sample, threads), repeats), 3)
+                for threads in BENCHMARK_THREADS
+            }
+            timings[str(rows)] = row_timings
+            serial = row_timings["1"]
+            if crossover is None and any(
+                value < serial * 0.9 for key, value in row_timings.items() if key != "1"
+            ):
+                crossover = rows
+        report["engines"][name] = {"latency_ms": timings, "crossover_rows": crossover}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark serial vs multi-threaded inference to find the crossover batch size."
+    )
+    parser.add_argument("--model", default=str(MODEL_PATH), help="Path to the joblib pipeline")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed calls per measurement")
+    args = parser.parse_args()
+
+    pipeline = load(Path(args.model))
+    try:
+        compiled = CompiledForest.from_pipeline(pipeline)
+    except ValueError:
+        compiled = None
+    print(json.dumps(crossover_benchmark(pipeline, compiled, args.repeats), indent=2))
+
+
+if __name__ == "__main__":
+    main()
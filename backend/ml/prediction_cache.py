@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .inference import PredictionOutput, StabilityConfig
+
+# Context fields that change the label, stability or indicators for the same
+# feature vector (see MLPredictor._heuristic_probability and _build_indicators).
+CONTEXT_KEYS: tuple[str, ...] = (
+    "known_bad_source",
+    "off_hours_activity",
+    "repeated_attempts",
+    "failed_logins",
+)
+
+
+class PredictionCache:
+    """Bounded LRU cache of PredictionOutput with a per-entry TTL.
+
+    Keys hash the normalized 77-feature vector together with the context
+    flags and the stability settings that influence the output.  Entries are
+    tagged with the model version they were computed for; the whole cache is
+    dropped as soon as a lookup or store arrives with a different version.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 300.0):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.model_version: str | None = None
+        self._entries: OrderedDict[bytes, tuple[float, PredictionOutput]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> "PredictionCache | None":
+        """Build the cache from IDS_PREDICTION_CACHE_* variables; size 0 disables it."""
+        size = int(os.environ.get("IDS_PREDICTION_CACHE_SIZE", 10_000))
+        if size <= 0:
+            return None
+        return cls(size, float(os.environ.get("IDS_PREDICTION_CACHE_TTL", 300.0)))
+
+    @staticmethod
+    def key(row: np.ndarray, context: dict[str, Any], stability: "StabilityConfig") -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(row, dtype=np.float64).tobytes())
+        digest.update(repr(tuple(context.get(name) for name in CONTEXT_KEYS)).encode("utf-8"))
+        digest.update(repr((stability.mode, stability.multipliers, stability.perturb_keys)).encode("utf-8"))
+        return digest.digest()
+
+    def get(self, key: bytes, model_version: str) -> PredictionOutput | None:
+        with self._lock:
+            self._check_version(model_version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, output = entry
+            if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _copy_output(output)
+
+    def put(self, key: bytes, output: PredictionOutput) -> None:
+        with self._lock:
+            self._check_version(output.model_version)
+            self._entries[key] = (time.monotonic(), _copy_output(output))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "model_version": self.model_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _check_version(self, model_version: str) -> None:
+        if model_version != self.model_version:
+            if self._entries:
+                self._entries.clear()
+                self.invalidations += 1
+            self.model_version = model_version
+
+
+def _copy_output(output: PredictionOutput) -> PredictionOutput:
+    # Callers own the lists/dicts they receive; never hand out the cached ones.
+    return replace(
+        output,
+        triggered_indicators=list(output.triggered_indicators),
+        feature_snapshot=dict(output.feature_snapshot),
+    )
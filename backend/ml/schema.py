@@ -8,6 +8,7 @@ ARTIFACTS_DIR = Path(__file__).resolve().parent / "artifacts"
 ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
 
 MODEL_PATH = ARTIFACTS_DIR / "rf_ids_model.joblib"
+INFERENCE_MODEL_PATH = ARTIFACTS_DIR / "rf_ids_inference.joblib"
 METRICS_PATH = ARTIFACTS_DIR / "evaluation_metrics.json"
 MODEL_INFO_PATH = ARTIFACTS_DIR / "model_info.json"
 FEATURES_PATH = ARTIFACTS_DIR / "rf_ids_features.json"
@@ -21,12 +21,25 @@ from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 
+from .compiled_forest import INFERENCE_ARTIFACT_FORMAT, CompiledForest, file_sha256, latency_report
 from .preprocessing import DatasetBundle, load_dataset_bundle
-from .schema import CANONICAL_FEATURES, FEATURES_PATH, METRICS_PATH, MODEL_INFO_PATH, MODEL_PATH
+from .schema import (
+    CANONICAL_FEATURES,
+    FEATURES_PATH,
+    INFERENCE_MODEL_PATH,
+    METRICS_PATH,
+    MODEL_INFO_PATH,
+    MODEL_PATH,
+)
 
 # All 77 canonical features are numeric; no categorical encoding is needed.
 NUMERIC_FEATURES: list[str] = CANONICAL_FEATURES
 
+MODEL_VERSION = "rf-cic-77f-v2"
+
+# Test rows used to compare the pipeline and the inference artifact.
+ARTIFACT_CHECK_ROWS = 5000
+
 
 def build_pipeline() -> Pipeline:
     return Pipeline(
@@ -80,6 +93,32 @@ def evaluate_bundle(pipeline: Pipeline, bundle: DatasetBundle) -> dict:
     return metrics
 
 
+def build_inference_artifact(pipeline: Pipeline, pipeline_sha256: str) -> CompiledForest:
+    """Slim inference form of the fitted pipeline.
+
+    The random forest is scale-invariant, so the StandardScaler is folded into
+    the split thresholds and the SimpleImputer is reduced to its fill vector.
+    ``pipeline_sha256`` is the digest of the persisted pipeline file; the
+    predictor ignores the artifact once that file no longer matches it.
+    """
+    artifact = CompiledForest.from_pipeline(pipeline, fold_scaler=True)
+    artifact.metadata = {
+        "format": INFERENCE_ARTIFACT_FORMAT,
+        "model_version": MODEL_VERSION,
+        "feature_count": len(CANONICAL_FEATURES),
+        "features": list(CANONICAL_FEATURES),
+        "pipeline_sha256": pipeline_sha256,
+    }
+    return artifact
+
+
+def compare_artifacts(pipeline: Pipeline, artifact: CompiledForest, frame: pd.DataFrame) -> dict:
+    sample = frame.iloc[:ARTIFACT_CHECK_ROWS]
+    comparison = artifact.verify_against(pipeline, sample)
+    comparison["latency"] = latency_report(pipeline, artifact, sample.iloc[:1000])
+    return comparison
+
+
 def train(cic_path: str, unsw_path: str | None = None) -> dict:
     cic_bundle = load_dataset_bundle(cic_path, "cic_ids2017")
 
@@ -109,7 +148,7 @@ def train(cic_path: str, unsw_path: str | None = None) -> dict:
     results = {
         "model": {
             "model_name": "Random Forest",
-            "model_version": "rf-cic-77f-v2",
+            "model_version": MODEL_VERSION,
             "features": CANONICAL_FEATURES,
             "feature_count": len(CANONICAL_FEATURES),
             "train_dataset": "CIC-IDS2017",
@@ -142,6 +181,10 @@ def train(cic_path: str, unsw_path: str | None = None) -> dict:
 
     dump(pipeline, MODEL_PATH)
 
+    artifact = build_inference_artifact(pipeline, file_sha256(MODEL_PATH))
+    dump(artifact, INFERENCE_MODEL_PATH)
+    results["inference_artifact"] = compare_artifacts(pipeline, artifact, X_test)
+
     METRICS_PATH.write_text(json.dumps(results, indent=2), encoding="utf-8")
 
     FEATURES_PATH.write_text(
@@ -152,7 +195,7 @@ def train(cic_path: str, unsw_path: str | None = None) -> dict:
         json.dumps(
             {
                 "model_name": "Random Forest",
-                "model_version": "rf-cic-77f-v2",
+                "model_version": MODEL_VERSION,
                 "feature_count": len(CANONICAL_FEATURES),
                 "features": CANONICAL_FEATURES,
                 "train_dataset": "CIC-IDS2017",
@@ -161,6 +204,16 @@ def train(cic_path: str, unsw_path: str | None = None) -> dict:
                     "model_path": str(MODEL_PATH),
                     "metrics_path": str(METRICS_PATH),
                     "features_path": str(FEATURES_PATH),
+                    "inference_model_path": str(INFERENCE_MODEL_PATH),
+                },
+                "inference_artifact": {
+                    **artifact.metadata,
+                    "path": str(INFERENCE_MODEL_PATH),
+                    "preprocessing": "scaler folded into split thresholds; imputer replaced by fill vector",
+                    "trees": artifact.n_trees,
+                    "nodes": artifact.n_nodes,
+                    "label_agreement": results["inference_artifact"]["label_agreement"],
+                    "latency": results["inference_artifact"]["latency"],
                 },
             },
             indent=2,
@@ -0,0 +1,160 @@
+# backend/report_codec.py
+"""Compact on-disk encoding of a report's traffic_context and raw_input.
+
+A report's ``traffic_context`` holds the normalized event and the prediction,
+including the 77-value ``feature_snapshot``; ``raw_input`` mostly repeats the
+event.  On disk this becomes three BLOBs:
+
+* ``features``: the snapshot packed in CANONICAL_FEATURES order, as float32
+  when every value survives the round trip exactly and float64 otherwise, so
+  decoded values are always identical to the ones stored;
+* ``traffic_context``: the context JSON with the snapshot replaced by a null
+  placeholder (keeping its key position);
+* ``raw_input``: a list of entries in key order, where a key whose value
+  equals the normalized event's (or, for canonical feature keys, the
+  snapshot's) is stored as a reference instead of a copy.
+
+JSON blobs are zlib-compressed unless IDS_REPORT_COMPRESSION_LEVEL is 0.
+"""
+import json
+import os
+import struct
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from ml.schema import CANONICAL_FEATURES
+
+COMPRESSION_LEVEL = int(os.environ.get("IDS_REPORT_COMPRESSION_LEVEL", 6))
+
+_FLOAT32 = struct.Struct(f"<{len(CANONICAL_FEATURES)}f")
+_FLOAT64 = struct.Struct(f"<{len(CANONICAL_FEATURES)}d")
+_FEATURE_INDEX = {name: index for index, name in enumerate(CANONICAL_FEATURES)}
+
+# First byte of every JSON blob.
+_PLAIN = b"j"
+_ZLIB = b"z"
+
+
+def encode_report(
+    traffic_context: Any, raw_input: Any
+) -> Tuple[Optional[bytes], Optional[bytes], Optional[bytes]]:
+    """Return the (features, traffic_context, raw_input) BLOBs for one report."""
+    features = None
+    values = None
+    if isinstance(traffic_context, dict) and isinstance(traffic_context.get("prediction"), dict):
+        snapshot = traffic_context["prediction"].get("feature_snapshot")
+        values = _snapshot_values(snapshot)
+        if values is not None:
+            features = _pack_features(values)
+            prediction = dict(traffic_context["prediction"], feature_snapshot=None)
+            traffic_context = dict(traffic_context, prediction=prediction)
+
+    event = traffic_context.get("event") if isinstance(traffic_context, dict) else None
+    context_blob = _dump(traffic_context) if traffic_context is not None else None
+    raw_blob = _dump(_raw_entries(raw_input, event, values)) if raw_input is not None else None
+    return features, context_blob, raw_blob
+
+
+def decode_report(
+    features: Optional[bytes], traffic_context: Any, raw_input: Any, with_raw_input: bool = True
+) -> Tuple[Any, Any]:
+    """Inverse of encode_report: rebuild the traffic_context and raw_input objects.
+
+    With ``with_raw_input=False`` the raw_input blob is not decoded and None
+    is returned in its place.  Legacy JSON text columns are decoded as
+    before (left as strings when they do not parse).
+    """
+    values = _unpack_features(features) if features is not None else None
+    context = _load(traffic_context)
+    if values is not None and isinstance(context, dict) and isinstance(context.get("prediction"), dict):
+        context["prediction"]["feature_snapshot"] = dict(zip(CANONICAL_FEATURES, values))
+    if not with_raw_input:
+        return context, None
+
+    raw = _load(raw_input)
+    if isinstance(raw_input, bytes):
+        event = context.get("event") if isinstance(context, dict) else None
+        raw = _raw_from_entries(raw, event, values)
+    return context, raw
+
+
+def _snapshot_values(snapshot: Any) -> Optional[Tuple[float, ...]]:
+    if not isinstance(snapshot, dict) or len(snapshot) != len(CANONICAL_FEATURES):
+        return None
+    if any(name != feature for name, feature in zip(snapshot, CANONICAL_FEATURES)):
+        return None
+    values = tuple(snapshot.values())
+    if not all(type(value) is float for value in values):
+        return None
+    return values
+
+
+def _pack_features(values: Tuple[float, ...]) -> bytes:
+    packed = _FLOAT32.pack(*values)
+    if _FLOAT32.unpack(packed) == values:
+        return packed
+    return _FLOAT64.pack(*values)
+
+
+def _unpack_features(blob: bytes) -> Tuple[float, ...]:
+    if len(blob) == _FLOAT32.size:
+        return _FLOAT32.unpack(blob)
+    return _FLOAT64.unpack(blob)
+
+
+def _raw_entries(raw_input: Any, event: Optional[Dict[str, Any]], values: Optional[Tuple[float, ...]]):
+    """``raw_input`` as a list of key references and [key, value] pairs.
+
+    A non-dict raw_input is stored as ``{"value": raw_input}``.
+    """
+    if not isinstance(raw_input, dict):
+        return {"value": raw_input}
+    entries = []
+    for key, value in raw_input.items():
+        if event is not None and key in event and _same(event[key], value):
+            entries.append(key)
+        elif values is not None and key in _FEATURE_INDEX and _same(values[_FEATURE_INDEX[key]], value):
+            entries.append(_FEATURE_INDEX[key])
+        else:
+            entries.append([key, value])
+    return entries
+
+
+def _raw_from_entries(entries: Any, event: Optional[Dict[str, Any]], values: Optional[Tuple[float, ...]]):
+    if isinstance(entries, dict):
+        return entries.get("value")
+    raw = {}
+    for entry in entries:
+        if isinstance(entry, str):
+            raw[entry] = event[entry]
+        elif isinstance(entry, int):
+            raw[CANONICAL_FEATURES[entry]] = values[entry]
+        else:
+            raw[entry[0]] = entry[1]
+    return raw
+
+
+def _same(left: Any, right: Any) -> bool:
+    # 1, 1.0 and True compare equal but serialize differently.
+    return type(left) is type(right) and left == right
+
+
+def _dump(document: Any) -> bytes:
+    text = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if COMPRESSION_LEVEL > 0:
+        return _ZLIB + zlib.compress(text, COMPRESSION_LEVEL)
+    return _PLAIN + text
+
+
+def _load(stored: Any) -> Any:
+    if stored is None:
+        return None
+    if isinstance(stored, bytes):
+        payload = stored[1:]
+        if stored[:1] == _ZLIB:
+            payload = zlib.decompress(payload)
+        return json.loads(payload)
+    try:
+        return json.loads(stored)
+    except Exception:
+        return stored
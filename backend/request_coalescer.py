@@ -0,0 +1,121 @@
+# backend/request_coalescer.py
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable
+
+
+def _bucket(value: int) -> str:
+    """Power-of-two histogram bucket label: 1, 2, 4, 8, ..."""
+    upper = 1
+    while upper < value:
+        upper *= 2
+    return str(upper)
+
+
+class RequestCoalescer:
+    """Collects concurrent single-item calls and hands them to ``handler`` as one batch.
+
+    A caller blocks in ``submit`` until its batch has been processed.  A batch
+    is dispatched once ``max_batch`` items are queued or the oldest queued
+    item has waited ``max_wait_ms``, whichever comes first.  ``handler`` gets
+    a list of items and must return one result per item, in order.  A result
+    that is an exception is raised to that item's caller only; if the
+    handler itself raises, every caller in that batch gets the exception.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[list[Any]], list[Any]],
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+    ):
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max(max_wait_ms, 0.0) / 1000.0
+        self._pending: list[tuple] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._batch_sizes: Counter = Counter()
+        self._queue_depths: Counter = Counter()
+        self._max_queue_depth = 0
+        self._items = 0
+        self._batches = 0
+        self._worker = threading.Thread(target=self._run, name="request-coalescer", daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Any:
+        future: Future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Coalescer is closed")
+            self._pending.append((time.monotonic(), item, future))
+            depth = len(self._pending)
+            self._queue_depths[_bucket(depth)] += 1
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+            self._condition.notify()
+        return future.result()
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+
+    def stats(self) -> dict[str, Any]:
+        with self._condition:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": len(self._pending),
+                "max_queue_depth": self._max_queue_depth,
+                "items": self._items,
+                "batches": self._batches,
+                "mean_batch_size": round(self._items / self._batches, 3) if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items(), key=lambda kv: int(kv[0]))),
+                "queue_depth_histogram": dict(sorted(self._queue_depths.items(), key=lambda kv: int(kv[0]))),
+            }
+
+    def _next_batch(self) -> list[tuple] | None:
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][0] + self.max_wait
+            while len(self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[: self.max_batch]
+            del self._pending[: self.max_batch]
+            self._batch_sizes[_bucket(len(batch))] += 1
+            self._items += len(batch)
+            self._batches += 1
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            futures = [future for _, _, future in batch]
+            try:
+                results = self.handler([item for _, item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError("Coalescer handler returned the wrong number of results")
+            except Exception as exception:
+                for future in futures:
+                    future.set_exception(exception)
+                continue
+            for future, result in zip(futures, results):
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
@@ -2,20 +2,48 @@ from __future__ import annotations
 
 import csv
 import io
+import itertools
 import json
+import logging
 import os
+import threading
 import uuid
+import zlib
 from datetime import datetime, timezone
 from pathlib import Path
 
-from flask import Flask, Response, jsonify, request
+import numpy as np
+import pandas as pd
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 
-from datasets_storage import list_datasets, save_uploaded_dataset
-from ml.inference import MLPredictor
-from ml.schema import CIC_COLUMN_ALIASES
-from storage import get_conn, init_db, insert_report
-
+from analysis_jobs import FINISHED_STATUSES, JOB_STATUSES, AnalysisJobQueue
+from datasets_storage import UPLOAD_DIR, list_datasets, save_uploaded_dataset
+from feature_cache import build_feature_cache, open_feature_cache
+from ml.inference import STABILITY_MODES, MLPredictor
+from ml.preprocessing import harmonize_frame
+from ml.schema import CANONICAL_FEATURES, CIC_COLUMN_ALIASES
+from request_coalescer import RequestCoalescer
+from storage import (
+    REPORT_COLUMNS,
+    ReportWriter,
+    decode_cursor,
+    init_db,
+    insert_reports,
+    iter_reports,
+    latest_report_id,
+    list_partitions,
+    list_reports,
+    normalize_bound,
+    parse_report_filters,
+    pool_stats,
+    report_aggregate,
+    report_changes,
+    report_summary,
+)
+
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)
@@ -24,6 +52,46 @@ init_db()
 
 predictor: MLPredictor | None = None
 
+# Number of CSV rows scored per model call by the CSV endpoint (and by
+# dataset analyses that fall back to reading rows one by one).
+ANALYSIS_BATCH_SIZE = int(os.environ.get("IDS_ANALYSIS_BATCH_SIZE", 256))
+
+# Rows read, scored and stored per chunk by dataset analyses.
+DATASET_CHUNK_ROWS = int(os.environ.get("IDS_DATASET_CHUNK_ROWS", 1000))
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "false").strip().lower() in {"1", "true", "yes"}
+
+
+# Optional micro-batching of concurrent /api/v1/analyze requests.
+COALESCE_ANALYZE = _env_flag("IDS_COALESCE_ANALYZE")
+COALESCE_MAX_BATCH = int(os.environ.get("IDS_COALESCE_MAX_BATCH", 32))
+COALESCE_MAX_WAIT_MS = float(os.environ.get("IDS_COALESCE_MAX_WAIT_MS", 5.0))
+
+# Upper bounds on events and body bytes accepted by one /api/v1/analyze/batch request.
+BATCH_MAX_EVENTS = int(os.environ.get("IDS_BATCH_MAX_EVENTS", 10_000))
+BATCH_MAX_BYTES = int(os.environ.get("IDS_BATCH_MAX_BYTES", 32 * 1024 * 1024))
+
+# Optional write-behind persistence for single-event reports.  Batch
+# endpoints always write their reports synchronously in one transaction.
+REPORT_WRITE_BEHIND = _env_flag("IDS_REPORT_WRITE_BEHIND")
+REPORT_FLUSH_ROWS = int(os.environ.get("IDS_REPORT_FLUSH_ROWS", 500))
+REPORT_FLUSH_INTERVAL_MS = float(os.environ.get("IDS_REPORT_FLUSH_INTERVAL_MS", 1000.0))
+
+# Upper bound on max_points for /api/v1/reports/aggregate.
+AGGREGATE_MAX_POINTS = int(os.environ.get("IDS_AGGREGATE_MAX_POINTS", 1000))
+
+# Worker threads running background dataset analysis jobs.
+JOB_WORKERS = int(os.environ.get("IDS_JOB_WORKERS", 2))
+
+analyze_coalescer: RequestCoalescer | None = None
+_analyze_coalescer_lock = threading.Lock()
+report_writer: ReportWriter | None = None
+_report_writer_lock = threading.Lock()
+job_queue: AnalysisJobQueue | None = None
+_job_queue_lock = threading.Lock()
+
 
 def get_predictor() -> MLPredictor:
     global predictor
@@ -32,10 +100,57 @@ def get_predictor() -> MLPredictor:
     return predictor
 
 
+def get_analyze_coalescer() -> RequestCoalescer:
+    global analyze_coalescer
+    with _analyze_coalescer_lock:
+        if analyze_coalescer is None:
+            analyze_coalescer = RequestCoalescer(
+                _coalesced_analysis_responses,
+                max_batch=COALESCE_MAX_BATCH,
+                max_wait_ms=COALESCE_MAX_WAIT_MS,
+            )
+    return analyze_coalescer
+
+
+def get_report_writer() -> ReportWriter:
+    global report_writer
+    with _report_writer_lock:
+        if report_writer is None:
+            report_writer = ReportWriter(
+                max_rows=REPORT_FLUSH_ROWS,
+                flush_interval=REPORT_FLUSH_INTERVAL_MS / 1000.0,
+            )
+    return report_writer
+
+
+def get_job_queue() -> AnalysisJobQueue:
+    """The analysis job queue; created on first use, resuming interrupted jobs."""
+    global job_queue
+    with _job_queue_lock:
+        if job_queue is None:
+            job_queue = AnalysisJobQueue(_run_analysis_job, workers=JOB_WORKERS)
+    return job_queue
+
+
 def _json_payload():
     return request.get_json(silent=True) or {}
 
 
+def _stability_mode_param(payload: dict | None = None) -> str | None:
+    """Read an optional per-request ``stability_mode`` from the query, form or JSON body."""
+    mode = (
+        request.args.get("stability_mode")
+        or request.form.get("stability_mode")
+        or (payload or {}).get("stability_mode")
+    )
+    if mode is None:
+        return None
+    mode = str(mode).strip().lower()
+    if mode not in STABILITY_MODES:
+        raise ValueError(f"stability_mode must be one of: {', '.join(STABILITY_MODES)}")
+    return mode
+
+
 def _normalize_event(event_payload: dict, fallback_id: str | None = None) -> dict:
     event_id = str(event_payload.get("id") or fallback_id or uuid.uuid4())
     captured_raw = event_payload.get("captured_at") or event_payload.get("timestamp")
@@ -65,89 +180,549 @@ def _normalize_event(event_payload: dict, fallback_id: str | None = None) -> dic
     }
 
 
-def _analysis_response(event_payload: dict) -> dict:
+def _validate_event(event_payload) -> None:
+    """Raise ValueError when ``event_payload`` cannot be normalized by _normalize_event."""
+    if not isinstance(event_payload, dict):
+        raise ValueError("Event must be a JSON object")
+    try:
+        _normalize_event(event_payload)
+    except (TypeError, ValueError, OverflowError) as exception:
+        raise ValueError(f"Invalid event: {exception}") from None
+
+
+def _read_batch_body() -> bytes | None:
+    """The request body, or None when it is larger than BATCH_MAX_BYTES.
+
+    A declared Content-Length is checked before anything is read; a body
+    without one is read only up to the limit.
+    """
+    if request.content_length is not None and request.content_length > BATCH_MAX_BYTES:
+        return None
+    body = request.stream.read(BATCH_MAX_BYTES + 1)
+    return body if len(body) <= BATCH_MAX_BYTES else None
+
+
+def _batch_items(body: bytes) -> list:
+    """Parse a JSON array, ``{"events": [...]}`` or an NDJSON body into its items."""
+    text = body.decode("utf-8", errors="replace").strip()
+    if not text:
+        return []
+
+    items = None
+    if request.mimetype != "application/x-ndjson":
+        try:
+            payload = json.loads(text)
+        except json.JSONDecodeError:
+            # Several JSON documents, one per line: fall through to NDJSON.
+            payload = None
+        if isinstance(payload, dict):
+            items = payload.get("events", [payload])
+        elif payload is not None:
+            items = payload
+    if items is None:
+        items = _ndjson_items(text)
+
+    if not isinstance(items, list):
+        raise ValueError("Expected a JSON array of events")
+    return items
+
+
+def _batch_event_payloads(items: list) -> list[dict]:
+    """Events carried by the batch ``items``, each checked with _validate_event.
+
+    Each item may be the event itself or ``{"event": {...}}``, as accepted by
+    /api/v1/analyze.  The ValueError names the first invalid event by its
+    1-based position.
+    """
+    events = []
+    for position, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            raise ValueError(f"Event {position} is not a JSON object")
+        event_payload = item.get("event") or item
+        try:
+            _validate_event(event_payload)
+        except ValueError as exception:
+            raise ValueError(f"Event {position}: {exception}") from None
+        events.append(event_payload)
+    return events
+
+
+def _ndjson_items(text: str) -> list:
+    items = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except json.JSONDecodeError as exception:
+            raise ValueError(f"Invalid JSON on line {line_number}: {exception.msg}") from None
+    return items
+
+
+def _canonical_features(event_payload: dict) -> dict:
+    """Canonical 77-feature values carried by the payload, if any."""
+    return {key: event_payload[key] for key in CANONICAL_FEATURES if key in event_payload}
+
+
+def _analysis_response(event_payload: dict, stability_mode: str | None = None) -> dict:
+    return _analysis_responses([event_payload], stability_mode, write_behind=True)[0]
+
+
+def _analysis_responses(
+    event_payloads: list[dict],
+    stability_mode: str | None = None,
+    write_behind: bool = False,
+    feature_matrix: np.ndarray | None = None,
+) -> list[dict]:
+    """Score a batch of events with one model pass and store their reports.
+
+    Reports are written in one transaction before returning, unless
+    ``write_behind`` is set and IDS_REPORT_WRITE_BEHIND is enabled, in which
+    case they are handed to the background ReportWriter.  ``feature_matrix``
+    (N x 77, canonical order) is scored as-is instead of the payloads'
+    canonical features.
+    """
     predictor_instance = get_predictor()
-    normalized_event = _normalize_event(event_payload)
-    output = predictor_instance.predict_from_event(normalized_event)
-
-    response = {
-        "event_id": normalized_event["id"],
-        "timestamp_utc": datetime.now(timezone.utc).isoformat(),
-        "event": normalized_event,
-        "prediction": {
-            "label": output.label,
-            "confidence": output.confidence,
-            "stability_score": output.stability_score,
-            "model_version": output.model_version,
-            "reasoning": output.reasoning,
-            "alternative_hypothesis": output.alternative_hypothesis,
-            "triggered_indicators": output.triggered_indicators,
-            "feature_snapshot": output.feature_snapshot,
-            "model_available": predictor_instance.available,
-        },
-    }
+    normalized_events = [_normalize_event(event_payload) for event_payload in event_payloads]
+    if feature_matrix is not None:
+        outputs = predictor_instance.predict_batch_from_matrix(
+            feature_matrix, contexts=normalized_events, stability_mode=stability_mode
+        )
+    else:
+        # Canonical feature values are not part of the normalized event shape but
+        # must reach the model so canonical payloads use the primary 77-feature path.
+        model_inputs = [
+            {**normalized_event, **_canonical_features(event_payload)}
+            for event_payload, normalized_event in zip(event_payloads, normalized_events)
+        ]
+        outputs = predictor_instance.predict_batch_from_events(
+            model_inputs, stability_mode=stability_mode
+        )
 
-    insert_report(
-        label=output.label,
-        confidence=output.confidence,
-        decision_status="Raw AI prediction",
-        decision_reason=output.reasoning,
-        traffic_context={
+    responses = []
+    reports = []
+    for event_payload, normalized_event, output in zip(event_payloads, normalized_events, outputs):
+        response = {
+            "event_id": normalized_event["id"],
+            "timestamp_utc": datetime.now(timezone.utc).isoformat(),
             "event": normalized_event,
-            "prediction": response["prediction"],
-        },
-        raw_input=event_payload,
+            "prediction": {
+                "label": output.label,
+                "confidence": output.confidence,
+                "stability_score": output.stability_score,
+                "model_version": output.model_version,
+                "reasoning": output.reasoning,
+                "alternative_hypothesis": output.alternative_hypothesis,
+                "triggered_indicators": output.triggered_indicators,
+                "feature_snapshot": output.feature_snapshot,
+                "model_available": predictor_instance.available,
+            },
+        }
+
+        reports.append(
+            {
+                "label": output.label,
+                "confidence": output.confidence,
+                "decision_status": "Raw AI prediction",
+                "decision_reason": output.reasoning,
+                "traffic_context": {
+                    "event": normalized_event,
+                    "prediction": response["prediction"],
+                },
+                "raw_input": event_payload,
+            }
+        )
+        responses.append(response)
+
+    if write_behind and REPORT_WRITE_BEHIND:
+        get_report_writer().add_many(reports)
+    else:
+        insert_reports(reports)
+    return responses
+
+
+def _coalesced_analysis_responses(items: list[tuple[dict, str | None]]) -> list[dict | Exception]:
+    """Coalescer handler: score queued (event_payload, stability_mode) pairs per mode.
+
+    Payloads are validated before they are queued.  If a batch still fails,
+    its items are scored one by one, so an exception only reaches the
+    caller whose event caused it.
+    """
+    responses: list[dict | Exception | None] = [None] * len(items)
+    for mode in {stability_mode for _, stability_mode in items}:
+        positions = [index for index, (_, stability_mode) in enumerate(items) if stability_mode == mode]
+        try:
+            batch = _analysis_responses(
+                [items[index][0] for index in positions], mode, write_behind=True
+            )
+        except Exception:
+            batch = []
+            for index in positions:
+                try:
+                    batch.append(_analysis_response(items[index][0], mode))
+                except Exception as exception:
+                    batch.append(exception)
+        for index, response in zip(positions, batch):
+            responses[index] = response
+    return responses
+
+
+def _iter_csv_analysis_batches(
+    rows, filename: str, limit: int, stability_mode: str | None = None, start: int = 0
+):
+    """Analyze up to ``limit`` CSV rows (every row when ``limit <= 0``).
+
+    ``rows`` are csv.reader rows, header first; the header is resolved into
+    a _CsvColumnPlan once and applied to every row.  The first ``start``
+    data rows are skipped (already analyzed).  Rows are scored in batches of
+    ANALYSIS_BATCH_SIZE and each batch's responses are yielded as soon as it
+    is done, so callers can stream them.
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    plan = _CsvColumnPlan(header)
+    batch: list[dict] = []
+    # Blank lines are skipped, as csv.DictReader does.
+    data_rows = itertools.islice((values for values in rows if values), start, None)
+    for index, values in enumerate(data_rows, start=start + 1):
+        if 0 < limit < index:
+            break
+        batch.append(_event_from_csv_row(index, values, filename, plan))
+        if len(batch) >= ANALYSIS_BATCH_SIZE:
+            yield _analysis_responses(batch, stability_mode)
+            batch = []
+    if batch:
+        yield _analysis_responses(batch, stability_mode)
+
+
+def _iter_dataset_analysis_batches(
+    file_path: Path, filename: str, limit: int, stability_mode: str | None = None, start: int = 0
+):
+    """Analyze a stored dataset chunk by chunk (every row when ``limit <= 0``).
+
+    The first ``start`` data rows are skipped (already analyzed, e.g. by an
+    interrupted job); row numbers still count from the top of the file.
+
+    Each chunk of DATASET_CHUNK_ROWS rows is read by pandas with the feature
+    columns as float64, mapped with harmonize_frame, scored with one model
+    call and stored with one bulk insert, so memory stays bounded by the
+    chunk size.  Only the legacy event columns are read as text.  When the
+    file's feature cache has been built, chunks are sliced from it instead
+    of parsing the CSV; otherwise its build is started in the background.
+    Files without CIC feature columns, and the rest of a file from the
+    first chunk pandas cannot parse (non-numeric feature values), go
+    through the row-by-row CSV path instead.
+    """
+    with open(file_path, "r", encoding="utf-8", errors="ignore", newline="") as handle:
+        header = next(csv.reader(handle), None)
+    if header is None:
+        return
+    plan = _CsvColumnPlan(header)
+    analyzed = start
+    if plan.features:
+        resolved = [(feature, CANONICAL_FEATURES.index(feature)) for feature, _, _ in plan.features]
+        port_position = None
+        if "destination_port" not in {feature for feature, _ in resolved}:
+            port_position = CANONICAL_FEATURES.index("destination_port")
+        cache = open_feature_cache(file_path)
+        if cache is not None:
+            chunks = cache.chunks(start, limit, DATASET_CHUNK_ROWS)
+        else:
+            # Datasets uploaded before the cache existed get one on first use.
+            _start_feature_cache_build(file_path)
+            chunks = _dataset_chunks(file_path, plan, limit, skip=start)
+        while True:
+            try:
+                chunk = next(chunks, None)
+            except ValueError:
+                break
+            if chunk is None:
+                return
+            legacy_columns, legacy_rows, matrix = chunk
+            events = []
+            for offset, (legacy, features) in enumerate(zip(legacy_rows, matrix.tolist())):
+                values = [""] * plan.width
+                for column, value in zip(legacy_columns, legacy):
+                    values[column] = value
+                canonical = {feature: features[position] for feature, position in resolved}
+                events.append(_event_from_csv_row(analyzed + offset + 1, values, filename, plan, canonical))
+            if port_position is not None:
+                # No Destination Port feature column: the model sees the legacy
+                # port field, as the row path does through the normalized event.
+                matrix = np.array(matrix, dtype=np.float64)
+                matrix[:, port_position] = [event["destination_port"] for event in events]
+            yield _analysis_responses(events, stability_mode, feature_matrix=matrix)
+            analyzed += len(events)
+    yield from _iter_csv_analysis_batches(_dataset_rows(file_path), filename, limit, stability_mode, start=analyzed)
+
+
+# Feature cells read as missing (0.0 after harmonize_frame) by dataset chunks.
+_DATASET_NA_VALUES = ["", "nan", "NaN", "NAN", "-nan", "NA", "N/A", "n/a", "null", "NULL", "None"]
+
+
+def _legacy_columns(plan: _CsvColumnPlan) -> list[int]:
+    """Columns read as text for the legacy event fields, in file order."""
+    return sorted({column for columns in plan.fields.values() for column in columns})
+
+
+# Builds run one at a time; each version (size, mtime) of a file is built at
+# most once per process, so a file that cannot be cached is not retried.
+_feature_cache_lock = threading.Lock()
+_feature_cache_started: set[tuple[Path, int, int]] = set()
+_feature_cache_started_lock = threading.Lock()
+
+
+def _build_dataset_feature_cache(file_path: Path):
+    """Build the feature cache of a stored dataset; skipped for files the chunk reader cannot handle.
+
+    Returns the existing cache when it is already up to date.
+    """
+    with open(file_path, "r", encoding="utf-8", errors="ignore", newline="") as handle:
+        header = next(csv.reader(handle), None)
+    if header is None:
+        return None
+    plan = _CsvColumnPlan(header)
+    if not plan.features:
+        return None
+    with _feature_cache_lock:
+        cache = open_feature_cache(file_path)
+        if cache is not None:
+            return cache
+        try:
+            return build_feature_cache(file_path, header, _legacy_columns(plan), _dataset_chunks(file_path, plan, 0))
+        except ValueError as exception:
+            # Non-numeric feature values: analyses of this file read the CSV.
+            logger.info("No feature cache for %s: %s", file_path.name, exception)
+            return None
+
+
+def _start_feature_cache_build(file_path: Path):
+    """Build the feature cache of ``file_path`` in a daemon thread, unless already started for this version."""
+    try:
+        stat = file_path.stat()
+    except OSError:
+        return
+    version = (file_path, stat.st_size, stat.st_mtime_ns)
+    with _feature_cache_started_lock:
+        if version in _feature_cache_started:
+            return
+        _feature_cache_started.add(version)
+
+    def build():
+        try:
+            _build_dataset_feature_cache(file_path)
+        except Exception:
+            logger.exception("Feature cache build failed for %s", file_path.name)
+
+    threading.Thread(target=build, name="feature-cache", daemon=True).start()
+
+
+def _dataset_chunks(file_path: Path, plan: _CsvColumnPlan, limit: int, skip: int = 0):
+    """(legacy columns, legacy text rows, harmonized N x 77 matrix) per chunk of the file.
+
+    The first ``skip`` data rows are parsed but dropped.  Raises ValueError
+    (from pandas) at the first chunk that does not parse.
+    """
+    feature_columns = sorted({column for _, column, _ in plan.features})
+    legacy_columns = _legacy_columns(plan)
+    # A column that is both a feature and a legacy field is read as text and
+    # converted per chunk (numpy's str -> float64 cast is float()-exact, which
+    # pd.to_numeric inside harmonize_frame is not).
+    numeric_columns = [column for column in feature_columns if column not in legacy_columns]
+    shared_columns = [column for column in feature_columns if column in legacy_columns]
+    reader = pd.read_csv(
+        file_path,
+        header=None,
+        skiprows=1,
+        names=range(plan.width),
+        usecols=sorted(set(feature_columns) | set(legacy_columns)),
+        dtype={**{column: "float64" for column in numeric_columns}, **{column: object for column in legacy_columns}},
+        # Parse numbers exactly as float() does on the row path.
+        float_precision="round_trip",
+        keep_default_na=False,
+        na_values={column: _DATASET_NA_VALUES for column in numeric_columns},
+        chunksize=DATASET_CHUNK_ROWS,
+        nrows=limit if limit > 0 else None,
+        encoding="utf-8",
+        encoding_errors="ignore",
     )
+    with reader:
+        for chunk in reader:
+            if skip:
+                dropped = min(skip, len(chunk))
+                chunk = chunk.iloc[dropped:]
+                skip -= dropped
+                if chunk.empty:
+                    continue
+            features = chunk[feature_columns]
+            for column in shared_columns:
+                text = chunk[column].fillna("").str.strip()
+                text = text.mask(text.isin(_DATASET_NA_VALUES), "nan")
+                features[column] = text.to_numpy(dtype=str).astype(np.float64)
+            features.columns = [plan.header[column] for column in feature_columns]
+            matrix = harmonize_frame(features, "cic_ids2017").to_numpy(dtype=np.float64)
+            legacy_rows = chunk[legacy_columns].fillna("").to_numpy(dtype=object).tolist()
+            yield legacy_columns, legacy_rows, matrix
+
+
+def _wants_ndjson_stream() -> bool:
+    """True when the client asked for ``stream=ndjson`` or accepts only NDJSON."""
+    stream = str(request.args.get("stream") or request.form.get("stream") or "").strip().lower()
+    if stream in {"1", "true", "ndjson"}:
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"])
+    return best == "application/x-ndjson"
+
+
+def _ndjson_response(batches, summary: dict) -> Response:
+    """Stream one JSON result per line, then a final ``{"summary": {...}}`` line.
+
+    If analysis fails part-way the last line is ``{"error": ...}`` instead.
+    """
+
+    def generate():
+        processed = 0
+        try:
+            for batch in batches:
+                for result in batch:
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+                processed += len(batch)
+        except Exception as exception:
+            yield json.dumps({"error": str(exception), "processed": processed}) + "\n"
+            return
+        yield json.dumps({"summary": {**summary, "processed": processed}}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
-    return response
 
+def _dataset_rows(file_path: Path):
+    with open(file_path, "r", encoding="utf-8", errors="ignore", newline="") as handle:
+        yield from csv.reader(handle)
 
-def _csv_dict_reader_from_upload(file_storage):
-    body = file_storage.stream.read().decode("utf-8", errors="ignore")
-    file_storage.stream.seek(0)
-    return csv.DictReader(io.StringIO(body))
 
+def _csv_rows_from_upload(file_storage):
+    """CSV rows (header first) decoded from the upload as they are pulled, so nothing past ``limit`` is read.
 
-def _extract_canonical_features_from_row(row: dict[str, str]) -> dict:
-    """Try to read all 77 canonical features from a CSV dict row using CIC-style aliases.
+    Werkzeug already spools large uploads to a temporary file; decoding it
+    incrementally keeps memory flat however big the file is.  The rows own
+    the upload's stream from here on: Flask closes uploaded files when the
+    view returns, before an NDJSON response has been streamed.
+    """
+    stream = file_storage.stream
+    file_storage.stream = io.BytesIO()
+    return _upload_rows(stream)
+
+
+def _upload_rows(stream):
+    with io.TextIOWrapper(stream, encoding="utf-8", errors="ignore", newline="") as text:
+        yield from csv.reader(text)
+
+
+# Columns probed, in order, for each legacy event field; the first
+# non-blank one wins.
+_CSV_LEGACY_FIELDS: dict[str, tuple[str, ...]] = {
+    "source_ip": ("source_ip", "srcip", "Src IP", "Source IP"),
+    "destination_ip": ("destination_ip", "dstip", "Dst IP", "Destination IP"),
+    "protocol": ("protocol", "proto", "Protocol"),
+    "label": ("Label", "label", "attack_cat"),
+    "destination_port": ("destination_port", "dsport", "Destination Port", "Dst Port"),
+    "source_port": ("source_port", "sport", "Src Port", "Source Port"),
+    "duration": ("duration_seconds", "duration", "dur", "Flow Duration"),
+    "flow_bytes_per_second": ("Flow Bytes/s", "Flow Byts/s", "bytes_per_second", "flow_bytes_per_second"),
+    "forward_packets": ("forward_packets", "spkts", "Tot Fwd Pkts", "Total Fwd Packets"),
+    "backward_packets": ("backward_packets", "dpkts", "Tot Bwd Pkts", "Total Backward Packets"),
+    "packets_per_second": ("packets_per_second", "Flow Packets/s", "Flow Pkts/s", "rate"),
+    "bytes": ("bytes_transferred_kb", "bytes", "flow_bytes", "sbytes", "Total Length of Fwd Packets"),
+    "failed_logins": ("failed_logins",),
+    "anomaly_score": ("anomaly_score",),
+    "context_risk_score": ("context_risk_score",),
+    "known_bad_source": ("known_bad_source",),
+    "off_hours_activity": ("off_hours_activity",),
+    "repeated_attempts": ("repeated_attempts",),
+}
+
+
+class _CsvColumnPlan:
+    """Column positions for one CSV header, resolved once per file.
+
+    ``features`` lists (canonical feature, column, divisor) for every
+    canonical feature found through CIC_COLUMN_ALIASES (first matching alias,
+    compared case-insensitively), and ``fields`` the candidate columns of
+    each _CSV_LEGACY_FIELDS entry (exact names).  Duplicate column names
+    resolve to the last such column, as csv.DictReader does.
+    """
+
+    def __init__(self, header: list[str]):
+        self.header = list(header)
+        self.width = len(header)
+        positions = {name: index for index, name in enumerate(header)}
+        lowered = {name.strip().lower(): name for name in dict.fromkeys(header)}
+        self.features: list[tuple[str, int, float | None]] = []
+        for feature, aliases in CIC_COLUMN_ALIASES.items():
+            for alias in aliases:
+                name = lowered.get(alias.strip().lower())
+                if name is not None:
+                    # Raw CIC files store Flow Duration in microseconds; the model
+                    # is trained on seconds (see ml.preprocessing.harmonize_frame).
+                    divisor = 1_000_000.0 if feature == "flow_duration" and alias == "Flow Duration" else None
+                    self.features.append((feature, positions[name], divisor))
+                    break
+        self.fields: dict[str, tuple[int, ...]] = {
+            field: tuple(positions[key] for key in keys if key in positions)
+            for field, keys in _CSV_LEGACY_FIELDS.items()
+        }
+
+
+def _extract_canonical_features_from_row(values: list[str], plan: _CsvColumnPlan) -> dict:
+    """Read the canonical features ``plan`` found in the header from one CSV row.
 
-    Returns a dict of {canonical_name: float} for every feature that could be
-    resolved.  Features not found in the row are omitted (they will default to
-    0.0inside MLPredictor._normalize_features).
+    Returns a dict of {canonical_name: float} for every feature whose value
+    parses.  Features not found in the row are omitted (they will default to
+    0.0 inside MLPredictor._normalize_features).
     """
-    # Build a case-insensitive index of the row's keys for fast alias lookup.
-    row_index: dict[str, str] = {k.strip().lower(): k for k in row}
+    if len(values) < plan.width:
+        values = values + [""] * (plan.width - len(values))
     result: dict[str, float] = {}
-    for feature, aliases in CIC_COLUMN_ALIASES.items():
-        for alias in aliases:
-            raw_key = row_index.get(alias.strip().lower())
-            if raw_key is not None:
-                raw_val = str(row[raw_key]).strip()
-                if raw_val not in {"", "nan", "inf", "-inf"}:
-                    try:
-                        result[feature] = float(raw_val)
-                    except ValueError:
-                        pass
-                break
+    for feature, column, divisor in plan.features:
+        raw_val = values[column].strip()
+        if raw_val not in {"", "nan", "inf", "-inf"}:
+            try:
+                value = float(raw_val)
+            except ValueError:
+                continue
+            result[feature] = value / divisor if divisor else value
     return result
 
 
-def _event_from_csv_row(row_index: int, row: dict[str, str], filename: str) -> dict:
-    def read(*keys, default=""):
-        for key in keys:
-            if key in row and str(row[key]).strip() != "":
-                return row[key]
+def _event_from_csv_row(
+    row_index: int,
+    values: list[str],
+    filename: str,
+    plan: _CsvColumnPlan,
+    canonical: dict[str, float] | None = None,
+) -> dict:
+    """Analysis event for one CSV row; ``canonical`` skips the per-row feature extraction."""
+    if len(values) < plan.width:
+        # Short rows: missing cells read as blank.
+        values = values + [""] * (plan.width - len(values))
+
+    def read(field, default=""):
+        for column in plan.fields[field]:
+            if values[column].strip() != "":
+                return values[column]
         return default
 
-    def read_float(*keys, default=0.0):
-        value = read(*keys, default=default)
+    def read_float(field, default=0.0):
+        value = read(field, default=default)
         try:
             return float(value)
         except (TypeError, ValueError):
             return float(default)
 
-    def read_int(*keys, default=0):
-        value = read(*keys, default=default)
+    def read_int(field, default=0):
+        value = read(field, default=default)
         try:
             return int(float(value))
         except (TypeError, ValueError):
@@ -160,36 +735,32 @@ def _event_from_csv_row(row_index: int, row: dict[str, str], filename: str) -> d
         )
 
     # --- identity / metadata fields (unchanged) ---
-    source_ip = read("source_ip", "srcip", "Src IP", "Source IP", default="0.0.0.0")
-    destination_ip = read("destination_ip", "dstip", "Dst IP", "Destination IP", default="0.0.0.0")
-    protocol = normalize_protocol(read("protocol", "proto", "Protocol", default="UNKNOWN"))
-    label = read("Label", "label", "attack_cat", default="")
+    source_ip = read("source_ip", default="0.0.0.0")
+    destination_ip = read("destination_ip", default="0.0.0.0")
+    protocol = normalize_protocol(read("protocol", default="UNKNOWN"))
+    label = read("label", default="")
 
     # --- attempt to extract all 77 canonical features from the row ---
-    canonical = _extract_canonical_features_from_row(row)
+    if canonical is None:
+        canonical = _extract_canonical_features_from_row(values, plan)
 
     # Derive legacy fields as a fallback for non-CIC CSVs that lack canonical names.
-    destination_port = read_int("destination_port", "dsport", "Destination Port", "Dst Port", default=0)
-    source_port = read_int("source_port", "sport", "Src Port", "Source Port", default=0)
-    duration = read_float("duration_seconds", "duration", "dur", "Flow Duration", default=1.0)
+    destination_port = read_int("destination_port", default=0)
+    source_port = read_int("source_port", default=0)
+    duration = read_float("duration", default=1.0)
     if duration > 10_000:
         # CIC raw files store duration in microseconds; convert here when
         # the canonical extractor above has NOT already done so.
         if "flow_duration" not in canonical:
             duration = duration / 1_000_000.0
-    flow_bytes_per_second = read_float(
-        "Flow Bytes/s", "Flow Byts/s", "bytes_per_second", "flow_bytes_per_second", default=0.0
-    )
-    forward_packets = read_float("forward_packets", "spkts", "Tot Fwd Pkts", "Total Fwd Packets", default=0.0)
-    backward_packets = read_float("backward_packets", "dpkts", "Tot Bwd Pkts", "Total Backward Packets", default=0.0)
-    packets_per_second = read_float("packets_per_second", "Flow Packets/s", "Flow Pkts/s", "rate", default=0.0)
+    flow_bytes_per_second = read_float("flow_bytes_per_second", default=0.0)
+    forward_packets = read_float("forward_packets", default=0.0)
+    backward_packets = read_float("backward_packets", default=0.0)
+    packets_per_second = read_float("packets_per_second", default=0.0)
     if packets_per_second == 0.0 and duration > 0:
         total_packets = forward_packets + backward_packets
         packets_per_second = total_packets / duration if duration else 0.0
-    bytes_kb = read_float(
-        "bytes_transferred_kb", "bytes", "flow_bytes", "sbytes",
-        "Total Length of Fwd Packets", default=0.0,
-    ) / 1024.0
+    bytes_kb = read_float("bytes", default=0.0) / 1024.0
     if bytes_kb == 0.0 and flow_bytes_per_second > 0 and duration > 0:
         bytes_kb = (flow_bytes_per_second * duration) / 1024.0
 
@@ -247,10 +818,18 @@ def root():
                 "/api/v1/ml/metadata",
                 "/api/v1/analyze",
                 "/api/v1/analyze/csv",
+                "/api/v1/analyze/batch",
+                "/api/v1/analyze/coalescer",
                 "/api/v1/datasets",
                 "/api/v1/datasets/upload",
                 "/api/v1/datasets/<dataset_id>/analyze",
+                "/api/v1/jobs",
+                "/api/v1/jobs/<job_id>",
+                "/api/v1/jobs/<job_id>/cancel",
+                "/api/v1/jobs/<job_id>/result",
                 "/api/v1/reports",
+                "/api/v1/reports/changes",
+                "/api/v1/reports/aggregate",
                 "/api/v1/reports/export",
             ],
         }
@@ -265,6 +844,10 @@ def health():
             "status": "ok",
             "model_available": predictor_instance.available,
             "model_version": predictor_instance.model_version,
+            "inference_engine": predictor_instance.engine,
+            "report_writer": report_writer.stats() if report_writer is not None else None,
+            "sqlite_pool": pool_stats(),
+            "report_partitions": [month for month, _ in list_partitions()],
         }
     )
 
@@ -276,6 +859,8 @@ def ml_metadata():
         {
             "model_available": predictor_instance.available,
             "model_version": predictor_instance.model_version,
+            "inference_engine": predictor_instance.engine,
+            "prediction_cache": predictor_instance.cache.stats() if predictor_instance.cache else None,
             "model_info": predictor_instance.model_info,
             "metrics": predictor_instance.metrics,
             "datasets": [
@@ -290,10 +875,50 @@ def ml_metadata():
 def analyze():
     payload = _json_payload()
     event_payload = payload.get("event") or payload
-    response = _analysis_response(event_payload)
+    try:
+        stability_mode = _stability_mode_param(payload)
+        _validate_event(event_payload)
+    except ValueError as exception:
+        return jsonify({"error": str(exception)}), 400
+    if COALESCE_ANALYZE:
+        response = get_analyze_coalescer().submit((event_payload, stability_mode))
+    else:
+        response = _analysis_response(event_payload, stability_mode)
     return jsonify(response), 200
 
 
+@app.post("/api/v1/analyze/batch")
+def analyze_batch():
+    body = _read_batch_body()
+    if body is None:
+        return jsonify({"error": f"Request body too large (max {BATCH_MAX_BYTES} bytes)"}), 413
+    try:
+        items = _batch_items(body)
+        stability_mode = _stability_mode_param()
+    except ValueError as exception:
+        return jsonify({"error": str(exception)}), 400
+    if len(items) > BATCH_MAX_EVENTS:
+        return jsonify({"error": f"Too many events (max {BATCH_MAX_EVENTS})"}), 413
+    try:
+        event_payloads = _batch_event_payloads(items)
+    except ValueError as exception:
+        return jsonify({"error": str(exception)}), 400
+
+    results = _analysis_responses(event_payloads, stability_mode) if event_payloads else []
+    return jsonify(
+        {
+            "processed": len(results),
+            "results": results,
+        }
+    )
+
+
+@app.get("/api/v1/analyze/coalescer")
+def analyze_coalescer_stats():
+    stats = analyze_coalescer.stats() if analyze_coalescer is not None else {}
+    return jsonify({"enabled": COALESCE_ANALYZE, **stats})
+
+
 @app.post("/api/v1/analyze/csv")
 def analyze_csv():
     if "file" not in request.files:
@@ -301,15 +926,17 @@ def analyze_csv():
 
     file_storage = request.files["file"]
     limit = int(request.form.get("limit", 50))
-    reader = _csv_dict_reader_from_upload(file_storage)
-
-    results = []
-    for index, row in enumerate(reader, start=1):
-        if index > limit:
-            break
-        event = _event_from_csv_row(index, row, file_storage.filename or "uploaded.csv")
-        results.append(_analysis_response(event))
+    try:
+        stability_mode = _stability_mode_param()
+    except ValueError as exception:
+        return jsonify({"error": str(exception)}), 400
+    batches = _iter_csv_analysis_batches(
+        _csv_rows_from_upload(file_storage), file_storage.filename or "uploaded.csv", limit, stability_mode
+    )
+    if _wants_ndjson_stream():
+        return _ndjson_response(batches, {"filename": file_storage.filename, "limit": limit})
 
+    results = [result for batch in batches for result in batch]
     return jsonify(
         {
             "filename": file_storage.filename,
@@ -331,153 +958,343 @@ def api_upload_dataset():
         return jsonify({"error": "No file field 'file'"}), 400
     try:
         meta = save_uploaded_dataset(request.files["file"])
-        return jsonify(meta), 201
     except Exception as exception:
         return jsonify({"error": str(exception)}), 400
+    # Analyses read the CSV until the cache is in place.
+    _start_feature_cache_build(UPLOAD_DIR / meta["stored_name"])
+    return jsonify(meta), 201
+
+
+def _stored_dataset(dataset_id: str):
+    """(metadata, stored file path) of an uploaded dataset; LookupError when either is missing."""
+    meta = next((item for item in list_datasets() if item.get("dataset_id") == dataset_id), None)
+    if not meta:
+        raise LookupError("Dataset not found")
+    file_path = UPLOAD_DIR / meta["stored_name"]
+    if not file_path.exists():
+        raise LookupError(f"File not found on server: {meta['stored_name']}")
+    return meta, file_path
+
+
+def _run_analysis_job(job: dict, start: int):
+    """AnalysisJobQueue runner: analyze the job's dataset from data row ``start`` on."""
+    _, file_path = _stored_dataset(job["dataset_id"])
+    return _iter_dataset_analysis_batches(
+        file_path, job["filename"], job["limit"], job["stability_mode"], start=start
+    )
+
+
+def _estimated_data_rows(file_path: Path, limit: int) -> int:
+    """Data rows the analysis will cover, counting lines (quoted line breaks count twice)."""
+    lines = 0
+    last = b"\n"
+    with open(file_path, "rb") as handle:
+        while block := handle.read(1 << 20):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    rows = max(lines - 1, 0)
+    return min(rows, limit) if limit > 0 else rows
 
 
 @app.post("/api/v1/datasets/<dataset_id>/analyze")
 def analyze_dataset(dataset_id: str):
     limit = int(request.args.get("limit", 100))
-    datasets = list_datasets()
-    meta = next((item for item in datasets if item.get("dataset_id") == dataset_id), None)
-    if not meta:
-        return jsonify({"error": "Dataset not found"}), 404
+    try:
+        stability_mode = _stability_mode_param()
+    except ValueError as exception:
+        return jsonify({"error": str(exception)}), 400
+    try:
+        meta, file_path = _stored_dataset(dataset_id)
+    except LookupError as exception:
+        return jsonify({"error": str(exception)}), 404
+
+    if _wants_ndjson_stream():
+        batches = _iter_dataset_analysis_batches(file_path, meta["filename"], limit, stability_mode)
+        return _ndjson_response(
+            batches, {"dataset_id": dataset_id, "filename": meta["filename"], "limit": limit}
+        )
 
-    file_path = Path(__file__).resolve().parent / "uploads" / meta["stored_name"]
-    if not file_path.exists():
-        return jsonify({"error": f"File not found on server: {meta['stored_name']}"}), 404
+    job = get_job_queue().submit(
+        dataset_id,
+        meta["filename"],
+        limit,
+        stability_mode,
+        total_rows=_estimated_data_rows(file_path, limit),
+    )
+    response = jsonify({"job": job})
+    response.status_code = 202
+    response.headers["Location"] = f"/api/v1/jobs/{job['job_id']}"
+    return response
 
-    with open(file_path, "r", encoding="utf-8", errors="ignore") as handle:
-        reader = csv.DictReader(handle)
-        results = []
-        for index, row in enumerate(reader, start=1):
-            if index > limit:
-                break
-            event = _event_from_csv_row(index, row, meta["filename"])
-            results.append(_analysis_response(event))
 
+@app.get("/api/v1/jobs")
+def jobs_list():
+    status = request.args.get("status")
+    if status and status not in JOB_STATUSES:
+        return jsonify({"error": f"status must be one of: {', '.join(JOB_STATUSES)}"}), 400
+    limit = int(request.args.get("limit", 50))
+    jobs_queue = get_job_queue()
+    return jsonify({"jobs": jobs_queue.list_jobs(status, limit), "stats": jobs_queue.stats()})
+
+
+@app.get("/api/v1/jobs/<job_id>")
+def job_status(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"job": job})
+
+
+@app.post("/api/v1/jobs/<job_id>/cancel")
+def job_cancel(job_id: str):
+    job = get_job_queue().cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"job": job})
+
+
+@app.get("/api/v1/jobs/<job_id>/result")
+def job_result(job_id: str):
+    result = get_job_queue().result(job_id)
+    if result is None:
+        return jsonify({"error": "Job not found"}), 404
+    job = result["job"]
+    if job["status"] not in FINISHED_STATUSES:
+        return jsonify({"error": f"Job is {job['status']}", "job": job}), 409
     return jsonify(
         {
-            "dataset_id": dataset_id,
-            "filename": meta["filename"],
-            "processed": len(results),
-            "limit": limit,
-            "results": results[:10],
+            "job": job,
+            "dataset_id": job["dataset_id"],
+            "filename": job["filename"],
+            "processed": job["processed"],
+            "limit": job["limit"],
+            "labels": result["labels"],
+            "mean_confidence": result["mean_confidence"],
+            "results": result["results"],
         }
     )
 
 
+def _report_fields_arg():
+    """``fields=`` as a tuple of REPORT_COLUMNS (all of them when absent)."""
+    fields = [field.strip() for field in request.args.get("fields", "").split(",") if field.strip()]
+    unknown = [field for field in fields if field not in REPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return tuple(fields) or REPORT_COLUMNS
+
+
 @app.get("/api/v1/reports")
 def reports_list():
-    date_from = request.args.get("from")
-    date_to = request.args.get("to")
+    date_from = normalize_bound(request.args.get("from"))
+    date_to = normalize_bound(request.args.get("to"))
     limit = int(request.args.get("limit", 50))
     offset = int(request.args.get("offset", 0))
+    cursor = request.args.get("cursor")
+    summary_only = str(request.args.get("summary_only", "")).strip().lower() in {"1", "true", "yes"}
+    try:
+        fields = _report_fields_arg()
+        filters = parse_report_filters(request.args)
+    except ValueError as exception:
+        return jsonify({"error": str(exception)}), 400
 
-    where = []
-    params = []
-    if date_from:
-        where.append("created_at >= ?")
-        params.append(date_from)
-    if date_to:
-        where.append("created_at <= ?")
-        params.append(date_to)
-
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-    conn = get_conn()
-    summary = conn.execute(
-        f"""
-        SELECT
-          COUNT(*) as total,
-          COALESCE(SUM(CASE WHEN label = 'Benign' THEN 1 ELSE 0 END), 0) as normal,
-          COALESCE(SUM(CASE WHEN label != 'Benign' THEN 1 ELSE 0 END), 0) as non_normal,
-          0 as verified_threat,
-          0 as suspicious
-        FROM reports {where_sql}
-        """,
-        params,
-    ).fetchone()
-
-    rows = conn.execute(
-        f"""
-        SELECT * FROM reports
-        {where_sql}
-        ORDER BY created_at DESC
-        LIMIT ? OFFSET ?
-        """,
-        params + [limit, offset],
-    ).fetchall()
-    conn.close()
+    if cursor:
+        # Keyset pagination: continue strictly after the last row of the
+        # previous page instead of skipping ``offset`` rows.
+        try:
+            decode_cursor(cursor)
+        except ValueError as exception:
+            return jsonify({"error": str(exception)}), 400
+        offset = 0
+
+    summary = report_summary(date_from, date_to, filters)
+    summary.update(verified_threat=0, suspicious=0)
+    if summary_only:
+        return jsonify(
+            {"summary": summary, "items": [], "limit": limit, "offset": offset, "next_cursor": None}
+        )
 
-    items = []
-    for row in rows:
-        item = dict(row)
-        for key in ("traffic_context", "raw_input"):
-            if item.get(key):
-                try:
-                    item[key] = json.loads(item[key])
-                except Exception:
-                    pass
-        items.append(item)
+    items, next_cursor = list_reports(date_from, date_to, filters, fields, limit, offset, cursor)
 
     return jsonify(
         {
-            "summary": dict(summary),
+            "summary": summary,
             "items": items,
             "limit": limit,
             "offset": offset,
+            "next_cursor": next_cursor,
         }
     )
 
 
-@app.get("/api/v1/reports/export")
-def export_reports():
-    fmt = request.args.get("format", "csv").lower()
-    date_from = request.args.get("from")
-    date_to = request.args.get("to")
-
-    where = []
-    params = []
-    if date_from:
-        where.append("created_at >= ?")
-        params.append(date_from)
-    if date_to:
-        where.append("created_at <= ?")
-        params.append(date_to)
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-    conn = get_conn()
-    rows = conn.execute(
-        f"SELECT * FROM reports {where_sql} ORDER BY created_at DESC",
-        params,
-    ).fetchall()
-    conn.close()
-
-    data = [dict(row) for row in rows]
-    if fmt == "json":
-        body = json.dumps(data, ensure_ascii=False)
-        return Response(
-            body,
-            mimetype="application/json",
-            headers={"Content-Disposition": "attachment; filename=reports.json"},
+@app.get("/api/v1/reports/changes")
+def reports_changes():
+    """Reports newer than ``since`` plus the summary, for polling clients.
+
+    The ETag is the newest committed report id.  A poll that is already
+    caught up (``since`` at or past that id) with a matching If-None-Match
+    costs one catalog lookup and returns 304; one that is still paging
+    through ``has_more`` gets its reports whatever ETag it sends.
+    """
+    try:
+        since = int(request.args.get("since", 0))
+        limit = int(request.args.get("limit", 100))
+        fields = _report_fields_arg()
+    except ValueError as exception:
+        return jsonify({"error": str(exception)}), 400
+
+    committed_id = latest_report_id()
+    etag = f"reports-{committed_id}"
+    if since >= committed_id and request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    items, latest_id, next_since = report_changes(since, fields, limit)
+    summary = report_summary()
+    summary.update(verified_threat=0, suspicious=0)
+    response = jsonify(
+        {
+            "summary": summary,
+            "items": items,
+            "since": since,
+            "latest_id": latest_id,
+            "next_since": next_since,
+            "has_more": next_since < latest_id,
+        }
+    )
+    response.set_etag(f"reports-{latest_id}")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _bucket_hours_arg() -> int:
+    """``bucket=`` (auto, hour, day, <n>h or <n>d) in hours; 0 for auto."""
+    value = request.args.get("bucket", "auto").strip().lower()
+    named = {"auto": 0, "hour": 1, "day": 24, "week": 168}
+    if value in named:
+        return named[value]
+    if value[-1:] in {"h", "d"} and value[:-1].isdigit() and int(value[:-1]) > 0:
+        return int(value[:-1]) * (24 if value.endswith("d") else 1)
+    raise ValueError("bucket must be auto, hour, day, week, <n>h or <n>d")
+
+
+@app.get("/api/v1/reports/aggregate")
+def reports_aggregate():
+    """Time-bucketed label/status counts and confidence statistics for charts."""
+    try:
+        bucket_hours = _bucket_hours_arg()
+        max_points = int(request.args.get("max_points", 100))
+        if not 1 <= max_points <= AGGREGATE_MAX_POINTS:
+            raise ValueError(f"max_points must be between 1 and {AGGREGATE_MAX_POINTS}")
+        return jsonify(
+            report_aggregate(
+                normalize_bound(request.args.get("from")),
+                normalize_bound(request.args.get("to")),
+                bucket_hours,
+                max_points,
+            )
         )
+    except ValueError as exception:
+        return jsonify({"error": str(exception)}), 400
+
+
+EXPORT_MIMETYPES = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _export_chunks(chunks):
+    """Exports carry traffic_context and raw_input as JSON text, as stored before."""
+    for rows in chunks:
+        for row in rows:
+            for key in ("traffic_context", "raw_input"):
+                if row[key] is not None and not isinstance(row[key], str):
+                    row[key] = json.dumps(row[key], ensure_ascii=False)
+        yield rows
+
 
+def _export_csv(chunks):
     output = io.StringIO()
-    fieldnames = data[0].keys() if data else ["created_at", "label", "confidence", "decision_status"]
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer = csv.DictWriter(output, fieldnames=REPORT_COLUMNS)
     writer.writeheader()
-    for row in data:
-        writer.writerow(row)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+    if output.tell():
+        yield output.getvalue()
+
+
+def _export_json(chunks):
+    yield "["
+    first = True
+    for rows in chunks:
+        body = ",".join(json.dumps(row, ensure_ascii=False) for row in rows)
+        yield body if first else "," + body
+        first = False
+    yield "]"
+
+
+def _export_ndjson(chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+def _gzip_stream(parts):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for part in parts:
+        data = compressor.compress(part.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@app.get("/api/v1/reports/export")
+def export_reports():
+    """Stream matching reports as CSV (default), a JSON array or NDJSON.
+
+    Reports are read and serialized chunk by chunk, so memory use does not
+    grow with the export size.  ``compression=gzip`` streams a .gz file.
+    """
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in EXPORT_MIMETYPES:
+        fmt = "csv"
+    compression = request.args.get("compression", "").lower()
+    if compression not in ("", "gzip"):
+        return jsonify({"error": f"Unsupported compression {compression!r}"}), 400
+    date_from = normalize_bound(request.args.get("from"))
+    date_to = normalize_bound(request.args.get("to"))
+    try:
+        filters = parse_report_filters(request.args)
+    except ValueError as exception:
+        return jsonify({"error": str(exception)}), 400
+
+    serializers = {"csv": _export_csv, "json": _export_json, "ndjson": _export_ndjson}
+    body = serializers[fmt](_export_chunks(iter_reports(date_from, date_to, filters=filters)))
+    filename = f"reports.{fmt}"
+    mimetype = EXPORT_MIMETYPES[fmt]
+    if compression == "gzip":
+        body = _gzip_stream(body)
+        filename += ".gz"
+        mimetype = "application/gzip"
 
     return Response(
-        output.getvalue(),
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=reports.csv"},
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
 
 
 if __name__ == "__main__":
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or __name__ == "__main__":
         predictor = MLPredictor()
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # Only the reloader's serving process resumes interrupted jobs.
+        get_job_queue()
     app.run(host="0.0.0.0", port=5001, debug=True, use_reloader=True)
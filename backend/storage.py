@@ -1,13 +1,54 @@
 # backend/storage.py
+import argparse
+import atexit
+import base64
+import logging
+import math
 import sqlite3
+import threading
 from pathlib import Path
-from datetime import datetime, timezone
+from collections import Counter
+from datetime import datetime, timedelta, timezone
 import json
-from typing import Optional, Dict, Any
+import os
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 
+from report_codec import decode_report, encode_report
+
+logger = logging.getLogger(__name__)
+
+# Catalog database: holds the report id sequence.  Reports themselves live in
+# one SQLite file per UTC calendar month in the partition directory next to it.
 DB_PATH = Path(__file__).resolve().parent / "reports.db"
 
-SCHEMA = """
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_sequence (
+  id INTEGER PRIMARY KEY CHECK (id = 0),
+  next_id INTEGER NOT NULL,
+  committed_id INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO report_sequence(id, next_id) VALUES (0, 1);
+CREATE TABLE IF NOT EXISTS partition_ids (
+  month TEXT PRIMARY KEY,
+  max_id INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Ids come from the catalog sequence but a report's partition from its
+# created_at, so an older month can receive a higher id than a newer one (a
+# write-behind row flushed after a month boundary).  partition_ids keeps each
+# partition's highest id so the delta feed knows which partitions to read.
+PARTITION_IDS_UPSERT_SQL = """INSERT INTO partition_ids(month, max_id) VALUES (?, ?)
+           ON CONFLICT(month) DO UPDATE SET max_id = MAX(max_id, excluded.max_id)"""
+
+PARTITION_GLOB = "reports_????_??.db"
+# Calendar months of reports kept, the current one included; 0 keeps all.
+RETENTION_MONTHS = int(os.environ.get("IDS_REPORT_RETENTION_MONTHS", 0))
+# "archive" moves expired partition files to the archive directory, "drop" deletes them.
+RETENTION_ACTION = os.environ.get("IDS_REPORT_RETENTION_ACTION", "archive").strip().lower()
+
+REPORTS_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS reports (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   created_at TEXT NOT NULL,
@@ -15,24 +56,362 @@ CREATE TABLE IF NOT EXISTS reports (
   confidence REAL NOT NULL,
   decision_status TEXT NOT NULL,
   decision_reason TEXT,
-  traffic_context TEXT,
-  raw_input TEXT
-);
-CREATE INDEX IF NOT EXISTS idx_reports_created_at ON reports(created_at);
+  source_ip TEXT,
+  destination_ip TEXT,
+  destination_port INTEGER,
+  model_version TEXT,
+  features BLOB,
+  traffic_context BLOB,
+  raw_input BLOB
+)
 """
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+SCHEMA = REPORTS_TABLE_SQL + """;
+CREATE INDEX IF NOT EXISTS idx_reports_created_at_id ON reports(created_at, id);
+DROP INDEX IF EXISTS idx_reports_created_at;
+CREATE INDEX IF NOT EXISTS idx_reports_label ON reports(label, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_reports_source_ip ON reports(source_ip, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_reports_destination_ip ON reports(destination_ip, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_reports_destination_port ON reports(destination_port, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_reports_model_version ON reports(model_version, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_reports_confidence ON reports(confidence);
+CREATE TABLE IF NOT EXISTS report_rollups (
+  granularity TEXT NOT NULL,
+  bucket TEXT NOT NULL,
+  label TEXT NOT NULL,
+  decision_status TEXT NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (granularity, bucket, label, decision_status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS confidence_rollups (
+  granularity TEXT NOT NULL,
+  bucket TEXT NOT NULL,
+  bin INTEGER NOT NULL,
+  count INTEGER NOT NULL,
+  confidence_sum REAL NOT NULL,
+  PRIMARY KEY (granularity, bucket, bin)
+) WITHOUT ROWID;
+"""
+
+INSERT_SQL = """INSERT INTO reports(id,created_at,label,confidence,decision_status,decision_reason,
+           source_ip,destination_ip,destination_port,model_version,features,traffic_context,raw_input)
+           VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)"""
+
+# Columns copied out of traffic_context so they can be filtered on with an index.
+INDEXED_CONTEXT_COLUMNS = ("source_ip", "destination_ip", "destination_port", "model_version")
+
+# Query filters accepted by the reports endpoints and the condition each maps to.
+REPORT_FILTERS = {
+    "label": ("label = ?", str),
+    "source_ip": ("source_ip = ?", str),
+    "destination_ip": ("destination_ip = ?", str),
+    "destination_port": ("destination_port = ?", int),
+    "model_version": ("model_version = ?", str),
+    "min_confidence": ("confidence >= ?", float),
+    "max_confidence": ("confidence <= ?", float),
+}
+
+ROLLUP_UPSERT_SQL = """INSERT INTO report_rollups(granularity,bucket,label,decision_status,count)
+           VALUES(?,?,?,?,?)
+           ON CONFLICT(granularity,bucket,label,decision_status) DO UPDATE SET count = count + excluded.count"""
+
+# Confidence histogram resolution of confidence_rollups: bin i counts
+# confidences in [i / CONFIDENCE_BINS, (i + 1) / CONFIDENCE_BINS).
+CONFIDENCE_BINS = 100
+CONFIDENCE_BIN_SQL = f"MAX(0, MIN(CAST(confidence * {CONFIDENCE_BINS} AS INTEGER), {CONFIDENCE_BINS - 1}))"
+CONFIDENCE_UPSERT_SQL = """INSERT INTO confidence_rollups(granularity,bucket,bin,count,confidence_sum)
+           VALUES(?,?,?,?,?)
+           ON CONFLICT(granularity,bucket,bin) DO UPDATE SET
+             count = count + excluded.count, confidence_sum = confidence_sum + excluded.confidence_sum"""
+
+# Rollup granularities and the created_at prefix that names their bucket
+# ("2024-05-01T13" for an hour, "2024-05-01" for a day).
+ROLLUP_PREFIX_LENGTHS = {"hour": 13, "day": 10}
+
+# Seconds a connection waits on a locked database before raising.
+BUSY_TIMEOUT = float(os.environ.get("IDS_SQLITE_BUSY_TIMEOUT_MS", 5000)) / 1000.0
+# Idle connections kept open by the pool.
+POOL_SIZE = int(os.environ.get("IDS_SQLITE_POOL_SIZE", 8))
+
+# WAL lets readers run while a write is in progress; synchronous=NORMAL is
+# durable across application crashes in WAL mode and only risks the last
+# transactions on power loss.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16384",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+def _open_conn(path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}")
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+def get_conn():
+    """Open a new tuned connection to the catalog that the caller must close.
+
+    Request handlers should use ``connection()`` instead, which reuses
+    pooled connections.
+    """
+    return _open_conn(DB_PATH)
+
+
+class ConnectionPool:
+    """Reuses open, already-configured connections to one database file.
+
+    A connection is checked out for the duration of one ``connection()``
+    block, so it is only ever used by one thread at a time.  Up to
+    ``max_idle`` connections are kept open between uses; extra ones are
+    closed when returned.
+    """
+
+    def __init__(self, path, max_idle: int = POOL_SIZE):
+        self.path = Path(path)
+        self.max_idle = max_idle
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+            self.opened += 1
+        return _open_conn(self.path)
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "max_idle": self.max_idle,
+                "opened": self.opened,
+                "reused": self.reused,
+            }
+
+
+_pools: Dict[Path, ConnectionPool] = {}
+_pool_lock = threading.Lock()
+_write_lock = threading.Lock()
+
+def get_pool(path=None) -> ConnectionPool:
+    """Pool for ``path``; the DB_PATH catalog by default."""
+    path = Path(path if path is not None else DB_PATH)
+    with _pool_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+@contextmanager
+def connection(path=None) -> Iterator[sqlite3.Connection]:
+    """Check a pooled connection to ``path`` (the catalog by default) out for the block.
+
+    Use ``with conn:`` inside the block to group writes into one
+    transaction; an uncommitted transaction is rolled back on return.
+    """
+    pool = get_pool(path)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+def pool_stats() -> Dict[str, Any]:
+    """Connection counts summed over the catalog and partition pools."""
+    with _pool_lock:
+        pools = list(_pools.values())
+    totals = {"pools": len(pools), "idle": 0, "opened": 0, "reused": 0}
+    for pool in pools:
+        stats = pool.stats()
+        for key in ("idle", "opened", "reused"):
+            totals[key] += stats[key]
+    return totals
+
+def _discard_pool(path: Path):
+    with _pool_lock:
+        pool = _pools.pop(Path(path), None)
+    if pool is not None:
+        pool.close()
+
+def _close_pool():
+    with _pool_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+atexit.register(_close_pool)
+
+def partition_dir() -> Path:
+    return Path(DB_PATH).parent / f"{Path(DB_PATH).stem}_partitions"
+
+def _partition_path(month: str) -> Path:
+    return partition_dir() / f"reports_{month.replace('-', '_')}.db"
+
+def _month(moment: datetime) -> str:
+    return f"{moment.year:04d}-{moment.month:02d}"
+
+def _partition_month(path: Path) -> str:
+    return path.stem[len("reports_"):].replace("_", "-")
+
+def list_partitions() -> List[Tuple[str, Path]]:
+    """(month, path) of every partition file, oldest first."""
+    directory = partition_dir()
+    if not directory.is_dir():
+        return []
+    return sorted((_partition_month(path), path) for path in directory.glob(PARTITION_GLOB))
+
+_ready_partitions: set = set()
+_partition_lock = threading.Lock()
+
+def _ensure_partition(month: str, apply_policy: bool = True) -> Path:
+    """Path of the partition for ``month`` ("YYYY-MM"), creating it if needed.
+
+    Creating the partition for the current month (a month rollover) also
+    applies the retention policy.
+    """
+    path = _partition_path(month)
+    with _partition_lock:
+        if path in _ready_partitions:
+            return path
+        created = not path.exists()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with connection(path) as conn:
+            conn.executescript(SCHEMA)
+            conn.commit()
+            if not created and not conn.execute("SELECT 1 FROM confidence_rollups LIMIT 1").fetchone():
+                # Partitions written before confidence_rollups existed.
+                with conn:
+                    _rebuild_confidence_rollups(conn)
+        _ready_partitions.add(path)
+    if created and apply_policy and month >= _month(datetime.now(timezone.utc)):
+        apply_retention()
+    return path
+
+def _partitions_for(date_from: Optional[str], date_to: Optional[str]) -> List[Tuple[str, Path]]:
+    """Partitions that can hold reports with ``date_from <= created_at <= date_to``, newest first.
+
+    A bound that is not an ISO timestamp does not prune anything.
+    """
+    lower, upper = _parse_bound(date_from), _parse_bound(date_to)
+    first = _month(lower) if lower else None
+    last = _month(upper) if upper else None
+    return [
+        (month, path)
+        for month, path in reversed(list_partitions())
+        if (first is None or month >= first) and (last is None or month <= last)
+    ]
+
+def apply_retention(months: Optional[int] = None, action: Optional[str] = None, now: Optional[datetime] = None) -> List[str]:
+    """Archive or drop every partition older than the newest ``months`` months.
+
+    Each expired month is a single file move or delete, however many
+    reports it holds.  Returns the retired months.
+    """
+    months = RETENTION_MONTHS if months is None else months
+    action = RETENTION_ACTION if action is None else action
+    if action not in ("archive", "drop"):
+        raise ValueError(f"Unknown retention action {action!r}")
+    if months <= 0:
+        return []
+    now = now or datetime.now(timezone.utc)
+    index = now.year * 12 + now.month - 1 - (months - 1)
+    cutoff = f"{index // 12:04d}-{index % 12 + 1:02d}"
+    expired = [(month, path) for month, path in list_partitions() if month < cutoff]
+    for month, path in expired:
+        _retire_partition(path, action)
+        logger.info("Retention: %s partition %s", "archived" if action == "archive" else "dropped", month)
+    return [month for month, _ in expired]
+
+def _retire_partition(path: Path, action: str):
+    with connection(path) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    with connection() as conn:
+        with conn:
+            conn.execute("DELETE FROM partition_ids WHERE month = ?", (_partition_month(path),))
+    with _partition_lock:
+        _ready_partitions.discard(path)
+        _discard_pool(path)
+        if action == "drop":
+            path.unlink()
+        else:
+            archive = partition_dir() / "archive"
+            archive.mkdir(exist_ok=True)
+            path.replace(archive / path.name)
+        for suffix in ("-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+def compact_partitions() -> List[str]:
+    """VACUUM every partition before the current month; returns their months.
+
+    Past months no longer receive writes, so they can be rebuilt without
+    free pages once and then stay compact.
+    """
+    current = _month(datetime.now(timezone.utc))
+    compacted = []
+    for month, path in list_partitions():
+        if month >= current:
+            continue
+        with connection(path) as conn:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        compacted.append(month)
+    return compacted
+
 def init_db():
-    conn = get_conn()
-    conn.executescript(SCHEMA)
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.executescript(CATALOG_SCHEMA)
+        conn.commit()
+        legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reports'").fetchone()
+        if legacy:
+            # Single-table databases from before partitioning.
+            _migrate_compact_storage(conn)
+            _migrate_indexed_columns(conn)
+            _migrate_to_partitions(conn)
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(report_sequence)")}
+        with conn:
+            if "committed_id" not in columns:
+                conn.execute("ALTER TABLE report_sequence ADD COLUMN committed_id INTEGER NOT NULL DEFAULT 0")
+            # Nothing is being written yet: every allocated id is settled.
+            conn.execute("UPDATE report_sequence SET committed_id = next_id - 1 WHERE id = 0")
+        # Partitions from before partition_ids, or whose write stopped before
+        # the catalog was updated.
+        max_ids = []
+        for month, path in list_partitions():
+            with connection(path) as partition:
+                newest = partition.execute("SELECT MAX(id) FROM reports").fetchone()[0]
+            if newest is not None:
+                max_ids.append((month, newest))
+        with conn:
+            conn.executemany(PARTITION_IDS_UPSERT_SQL, max_ids)
+    apply_retention()
 
-def insert_report(
+def _report_row(
     label: str,
     confidence: float,
     decision_status: str,
@@ -41,19 +420,907 @@ def insert_report(
     raw_input: Optional[Dict[str, Any]] = None,
 ):
     created_at = datetime.now(timezone.utc).isoformat()
-    conn = get_conn()
-    conn.execute(
-        """INSERT INTO reports(created_at,label,confidence,decision_status,decision_reason,traffic_context,raw_input)
-           VALUES(?,?,?,?,?,?,?)""",
-        (
-            created_at,
-            str(label),
-            float(confidence),
-            str(decision_status),
-            str(decision_reason) if decision_reason is not None else None,
-            json.dumps(traffic_context, ensure_ascii=False) if traffic_context is not None else None,
-            json.dumps(raw_input, ensure_ascii=False) if raw_input is not None else None,
-        ),
+    return (
+        created_at,
+        str(label),
+        float(confidence),
+        str(decision_status),
+        str(decision_reason) if decision_reason is not None else None,
+        *_indexed_values(traffic_context),
+        *encode_report(traffic_context, raw_input),
+    )
+
+def _indexed_values(traffic_context: Any) -> tuple:
+    """INDEXED_CONTEXT_COLUMNS values taken from a report's traffic_context."""
+    context = traffic_context if isinstance(traffic_context, dict) else {}
+    event = context.get("event") if isinstance(context.get("event"), dict) else {}
+    prediction = context.get("prediction") if isinstance(context.get("prediction"), dict) else {}
+    port = event.get("destination_port")
+    try:
+        port = int(port) if port is not None else None
+    except (TypeError, ValueError):
+        port = None
+    return (
+        str(event["source_ip"]) if event.get("source_ip") is not None else None,
+        str(event["destination_ip"]) if event.get("destination_ip") is not None else None,
+        port,
+        str(prediction["model_version"]) if prediction.get("model_version") is not None else None,
+    )
+
+def _migrate_compact_storage(conn: sqlite3.Connection) -> bool:
+    """Rewrite a pre-BLOB reports table (JSON text columns) in the compact layout.
+
+    Rows keep their ids; returns True when a migration ran.
+    """
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(reports)")}
+    if not columns or "features" in columns:
+        return False
+    logger.info("Migrating %s to the compact report layout", DB_PATH)
+    with conn:
+        conn.execute("ALTER TABLE reports RENAME TO reports_legacy")
+        conn.execute(REPORTS_TABLE_SQL)
+        source = conn.execute(
+            "SELECT id, created_at, label, confidence, decision_status, decision_reason, traffic_context, raw_input"
+            " FROM reports_legacy ORDER BY id"
+        )
+        while True:
+            rows = source.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            decoded = [decode_report(None, row["traffic_context"], row["raw_input"]) for row in rows]
+            conn.executemany(
+                "INSERT INTO reports(id,created_at,label,confidence,decision_status,decision_reason,"
+                "source_ip,destination_ip,destination_port,model_version,features,traffic_context,raw_input)"
+                " VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                [
+                    (*tuple(row)[:6], *_indexed_values(context), *encode_report(context, raw))
+                    for row, (context, raw) in zip(rows, decoded)
+                ],
+            )
+        conn.execute(
+            "UPDATE sqlite_sequence SET seq = MAX(seq, (SELECT seq FROM sqlite_sequence WHERE name = 'reports_legacy'))"
+            " WHERE name = 'reports'"
+        )
+        conn.execute("DROP TABLE reports_legacy")
+    return True
+
+def _migrate_indexed_columns(conn: sqlite3.Connection):
+    """Add and backfill INDEXED_CONTEXT_COLUMNS on a compact table created without them."""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(reports)")}
+    if not columns or all(column in columns for column in INDEXED_CONTEXT_COLUMNS):
+        return
+    logger.info("Adding indexed report columns to %s", DB_PATH)
+    with conn:
+        conn.execute("ALTER TABLE reports ADD COLUMN source_ip TEXT")
+        conn.execute("ALTER TABLE reports ADD COLUMN destination_ip TEXT")
+        conn.execute("ALTER TABLE reports ADD COLUMN destination_port INTEGER")
+        conn.execute("ALTER TABLE reports ADD COLUMN model_version TEXT")
+        source = conn.execute("SELECT id, traffic_context FROM reports ORDER BY id")
+        while True:
+            rows = source.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            conn.executemany(
+                "UPDATE reports SET source_ip = ?, destination_ip = ?, destination_port = ?, model_version = ?"
+                " WHERE id = ?",
+                [
+                    (*_indexed_values(decode_report(None, row["traffic_context"], None, with_raw_input=False)[0]), row["id"])
+                    for row in rows
+                ],
+            )
+
+def _migrate_to_partitions(conn: sqlite3.Connection):
+    """Move the catalog's legacy reports table into monthly partition files."""
+    logger.info("Splitting %s into monthly partitions", DB_PATH)
+    source = conn.execute(
+        "SELECT id, created_at, label, confidence, decision_status, decision_reason, source_ip, destination_ip,"
+        " destination_port, model_version, features, traffic_context, raw_input FROM reports ORDER BY id"
+    )
+    months = set()
+    while True:
+        rows = source.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            break
+        by_month: Dict[str, List[tuple]] = {}
+        for row in rows:
+            by_month.setdefault(row["created_at"][:7], []).append(tuple(row))
+        for month, month_rows in by_month.items():
+            # OR IGNORE: a migration interrupted after some partitions were
+            # written can simply run again.
+            with connection(_ensure_partition(month, apply_policy=False)) as partition:
+                with partition:
+                    partition.executemany(INSERT_SQL.replace("INSERT", "INSERT OR IGNORE", 1), month_rows)
+        months.update(by_month)
+    for month in months:
+        with connection(_partition_path(month)) as partition:
+            _rebuild_partition_rollups(partition)
+    last_id = conn.execute(
+        "SELECT MAX(COALESCE((SELECT MAX(id) FROM reports), 0),"
+        " COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'reports'), 0))"
+    ).fetchone()[0]
+    with conn:
+        conn.execute("UPDATE report_sequence SET next_id = MAX(next_id, ?) WHERE id = 0", (last_id + 1,))
+        conn.execute("DROP TABLE reports")
+        conn.execute("DROP TABLE IF EXISTS report_rollups")
+
+def insert_report(
+    label: str,
+    confidence: float,
+    decision_status: str,
+    decision_reason: Optional[str] = None,
+    traffic_context: Optional[Dict[str, Any]] = None,
+    raw_input: Optional[Dict[str, Any]] = None,
+):
+    _write_rows([_report_row(label, confidence, decision_status, decision_reason, traffic_context, raw_input)])
+
+def insert_reports(reports: List[Dict[str, Any]]):
+    """Insert many reports in one transaction per monthly partition.
+
+    Each item holds insert_report()'s keyword arguments.  All reports of a
+    call normally fall in one month, so either every report is stored or,
+    if any insert fails, none is.
+    """
+    if not reports:
+        return
+    _write_rows([_report_row(**report) for report in reports])
+
+def _write_rows(rows: List[tuple]):
+    """Store _report_row() tuples in their monthly partitions with fresh ids.
+
+    The catalog write lock (``BEGIN IMMEDIATE``) is held from id allocation
+    until ``committed_id`` is advanced, so writes are serialized across
+    processes as well as threads and ids become visible in order: once
+    ``committed_id`` is advanced, every report up to it is readable.
+    """
+    if not rows:
+        return
+    with _write_lock:
+        months = {row[0][:7] for row in rows}
+        # Before taking the catalog lock: a new partition can trigger
+        # retention, which updates the catalog on its own connection.
+        paths = {month: _ensure_partition(month) for month in sorted(months)}
+        with connection() as catalog:
+            catalog.execute("BEGIN IMMEDIATE")
+            try:
+                first_id = catalog.execute("SELECT next_id FROM report_sequence WHERE id = 0").fetchone()[0]
+                catalog.execute("UPDATE report_sequence SET next_id = next_id + ? WHERE id = 0", (len(rows),))
+                by_month: Dict[str, List[tuple]] = {}
+                for offset, row in enumerate(rows):
+                    by_month.setdefault(row[0][:7], []).append((first_id + offset, *row))
+                for month, month_rows in by_month.items():
+                    with connection(paths[month]) as conn:
+                        with conn:
+                            conn.executemany(INSERT_SQL, month_rows)
+                            _update_rollups(conn, [row[1:] for row in month_rows])
+            except BaseException:
+                # Keep the ids reserved: an earlier month may already hold some of them.
+                if catalog.in_transaction:
+                    catalog.commit()
+                raise
+            catalog.executemany(
+                PARTITION_IDS_UPSERT_SQL,
+                [(month, month_rows[-1][0]) for month, month_rows in by_month.items()],
+            )
+            catalog.execute(
+                "UPDATE report_sequence SET committed_id = MAX(committed_id, ?) WHERE id = 0",
+                (first_id + len(rows) - 1,),
+            )
+            catalog.commit()
+
+def _update_rollups(conn: sqlite3.Connection, rows: List[tuple]):
+    """Add freshly inserted report rows to the rollups, inside the caller's transaction."""
+    counts: Counter = Counter()
+    confidence_counts: Counter = Counter()
+    confidence_sums: Dict[tuple, float] = {}
+    for created_at, label, confidence, decision_status, *_ in rows:
+        confidence_bin = _confidence_bin(confidence)
+        for granularity, length in ROLLUP_PREFIX_LENGTHS.items():
+            counts[(granularity, created_at[:length], label, decision_status)] += 1
+            key = (granularity, created_at[:length], confidence_bin)
+            confidence_counts[key] += 1
+            confidence_sums[key] = confidence_sums.get(key, 0.0) + confidence
+    conn.executemany(ROLLUP_UPSERT_SQL, [(*key, count) for key, count in counts.items()])
+    conn.executemany(
+        CONFIDENCE_UPSERT_SQL,
+        [(*key, count, confidence_sums[key]) for key, count in confidence_counts.items()],
     )
-    conn.commit()
-    conn.close()
+
+def _confidence_bin(confidence: float) -> int:
+    """Python twin of CONFIDENCE_BIN_SQL."""
+    return max(0, min(int(confidence * CONFIDENCE_BINS), CONFIDENCE_BINS - 1))
+
+def rebuild_rollups() -> int:
+    """Recompute every partition's rollups from its reports; returns the report count."""
+    total = 0
+    for _, path in list_partitions():
+        with connection(path) as conn:
+            total += _rebuild_partition_rollups(conn)
+    return total
+
+def _rebuild_partition_rollups(conn: sqlite3.Connection) -> int:
+    with conn:
+        conn.execute("DELETE FROM report_rollups")
+        for granularity, length in ROLLUP_PREFIX_LENGTHS.items():
+            conn.execute(
+                f"""
+                INSERT INTO report_rollups(granularity,bucket,label,decision_status,count)
+                SELECT ?, substr(created_at, 1, {length}), label, decision_status, COUNT(*)
+                FROM reports
+                GROUP BY 2, 3, 4
+                """,
+                (granularity,),
+            )
+        _rebuild_confidence_rollups(conn)
+    return conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+def _rebuild_confidence_rollups(conn: sqlite3.Connection):
+    """Recompute confidence_rollups from reports, inside the caller's transaction."""
+    conn.execute("DELETE FROM confidence_rollups")
+    for granularity, length in ROLLUP_PREFIX_LENGTHS.items():
+        conn.execute(
+            f"""
+            INSERT INTO confidence_rollups(granularity,bucket,bin,count,confidence_sum)
+            SELECT ?, substr(created_at, 1, {length}), {CONFIDENCE_BIN_SQL}, COUNT(*), SUM(confidence)
+            FROM reports
+            GROUP BY 2, 3
+            """,
+            (granularity,),
+        )
+
+# Rows fetched per round trip when streaming reports out of the database.
+EXPORT_CHUNK_ROWS = int(os.environ.get("IDS_EXPORT_CHUNK_ROWS", 1000))
+
+# Report fields returned by the API, in order.
+REPORT_COLUMNS = (
+    "id",
+    "created_at",
+    "label",
+    "confidence",
+    "decision_status",
+    "decision_reason",
+    "traffic_context",
+    "raw_input",
+)
+
+# Stored columns each report field is decoded from; the blob fields depend
+# on each other (see report_codec).
+_FIELD_SOURCES = {
+    "traffic_context": ("features", "traffic_context"),
+    "raw_input": ("features", "traffic_context", "raw_input"),
+}
+
+def report_select_sql(fields=REPORT_COLUMNS) -> str:
+    """SELECT reading only the stored columns needed for ``fields``.
+
+    ``created_at`` and ``id`` are always selected (they form the page cursor).
+    """
+    columns = ["id", "created_at"]
+    for field in fields:
+        for column in _FIELD_SOURCES.get(field, (field,)):
+            if column not in columns:
+                columns.append(column)
+    return f"SELECT {', '.join(columns)} FROM reports"
+
+REPORT_SELECT_SQL = report_select_sql()
+
+def report_from_row(row: sqlite3.Row, fields=REPORT_COLUMNS) -> Dict[str, Any]:
+    """API dict with ``fields`` for a row selected with report_select_sql(fields).
+
+    The JSON blobs are only decoded when traffic_context or raw_input is requested.
+    """
+    item = {field: row[field] for field in fields if field not in _FIELD_SOURCES}
+    if "traffic_context" in fields or "raw_input" in fields:
+        traffic_context, raw_input = decode_report(
+            row["features"],
+            row["traffic_context"],
+            row["raw_input"] if "raw_input" in fields else None,
+            with_raw_input="raw_input" in fields,
+        )
+        if "traffic_context" in fields:
+            item["traffic_context"] = traffic_context
+        if "raw_input" in fields:
+            item["raw_input"] = raw_input
+        item = {field: item[field] for field in fields}
+    return item
+
+def iter_reports(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Yield decoded reports newest first in lists of at most ``chunk_rows`` rows.
+
+    Partitions in the range are read newest first, each from one open
+    cursor with fetchmany, so memory stays bounded by the chunk size however
+    many reports match.  A pooled connection is held until the generator
+    moves on to the next partition, is exhausted or is closed.
+    """
+    where_sql, params = _report_where_sql(date_from, date_to, filters)
+    for _, path in _partitions_for(date_from, date_to):
+        with connection(path) as conn:
+            cursor = conn.execute(
+                f"{REPORT_SELECT_SQL} {where_sql} ORDER BY created_at DESC, id DESC",
+                params,
+            )
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    yield [report_from_row(row) for row in rows]
+            finally:
+                cursor.close()
+
+def list_reports(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    fields=REPORT_COLUMNS,
+    limit: int = 50,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+):
+    """One newest-first page of reports as ``(items, next_cursor)``.
+
+    ``cursor`` (a previous page's next_cursor) replaces ``offset`` and seeks
+    past the last row seen via the (created_at, id) index.  Partitions are
+    read newest first and only until the page is full.  Raises ValueError
+    for a malformed cursor.
+    """
+    where_sql, params = _report_where_sql(date_from, date_to, filters)
+    partitions = _partitions_for(date_from, date_to)
+    if cursor:
+        created_at, report_id = decode_cursor(cursor)
+        where_sql += (" AND " if where_sql else "WHERE ") + "(created_at, id) < (?, ?)"
+        params = params + [created_at, report_id]
+        partitions = [(month, path) for month, path in partitions if month <= created_at[:7]]
+        offset = 0
+
+    select = report_select_sql(fields)
+    rows: List[sqlite3.Row] = []
+    for _, path in partitions:
+        wanted = limit + 1 - len(rows)
+        if wanted <= 0:
+            break
+        with connection(path) as conn:
+            page = conn.execute(
+                f"{select} {where_sql} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [wanted, offset],
+            ).fetchall()
+            if offset and not page:
+                # The whole partition falls inside the offset.
+                offset -= conn.execute(f"SELECT COUNT(*) FROM reports {where_sql}", params).fetchone()[0]
+            else:
+                offset = 0
+        rows.extend(page)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if has_more and rows else None
+    return [report_from_row(row, fields) for row in rows], next_cursor
+
+def latest_report_id() -> int:
+    """Id of the newest report whose write has completed (0 when there are none)."""
+    with connection() as conn:
+        return conn.execute("SELECT committed_id FROM report_sequence WHERE id = 0").fetchone()[0]
+
+def report_changes(since: int, fields=REPORT_COLUMNS, limit: int = 100):
+    """Reports with an id above ``since``, oldest first, as ``(items, latest_id, next_since)``.
+
+    Only reports up to latest_report_id() are returned, so a client that
+    polls again with ``next_since`` never skips a report; ``next_since`` is
+    below ``latest_id`` while more reports than ``limit`` are waiting.
+    Only partitions whose highest id (partition_ids) is above ``since`` are
+    read; ids are not ordered by month, so their rows are merged by id.
+    """
+    latest = latest_report_id()
+    if since >= latest:
+        return [], latest, since
+
+    with connection() as conn:
+        months = {row[0] for row in conn.execute("SELECT month FROM partition_ids WHERE max_id > ?", (since,))}
+
+    select = report_select_sql(fields)
+    rows: List[sqlite3.Row] = []
+    for month, path in list_partitions():
+        if month not in months:
+            continue
+        with connection(path) as conn:
+            rows.extend(
+                conn.execute(
+                    f"{select} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?", (since, latest, limit + 1)
+                ).fetchall()
+            )
+    rows.sort(key=lambda row: row["id"])
+    rows = rows[: limit + 1]
+    next_since = rows[limit - 1]["id"] if len(rows) > limit else latest
+    return [report_from_row(row, fields) for row in rows[:limit]], latest, next_since
+
+def _report_where_sql(date_from: Optional[str], date_to: Optional[str], filters: Optional[Dict[str, Any]]):
+    where, params = report_filter_sql(filters)
+    if date_from:
+        where.append("created_at >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("created_at <= ?")
+        params.append(date_to)
+    return ("WHERE " + " AND ".join(where)) if where else "", params
+
+def encode_cursor(created_at: str, report_id: int) -> str:
+    """Opaque keyset cursor for the report that ends a page."""
+    payload = json.dumps([created_at, report_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, report_id = json.loads(payload)
+    except (ValueError, TypeError) as exception:
+        raise ValueError("Invalid cursor") from exception
+    if not isinstance(created_at, str) or not isinstance(report_id, int):
+        raise ValueError("Invalid cursor")
+    return created_at, report_id
+
+def normalize_bound(value: Optional[str]) -> Optional[str]:
+    """Rewrite an ISO date/time filter in the stored created_at format (UTC).
+
+    Naive values are taken as UTC.  Values that do not parse are returned
+    unchanged and keep plain string comparison.
+    """
+    parsed = _parse_bound(value)
+    return parsed.isoformat() if parsed is not None else value
+
+def _parse_bound(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def _ceil(moment: datetime, step: timedelta) -> datetime:
+    floor = _floor(moment, step)
+    return floor if floor == moment else floor + step
+
+def _floor(moment: datetime, step: timedelta) -> datetime:
+    if step == timedelta(days=1):
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _bucket_key(moment: datetime, granularity: str) -> str:
+    return moment.isoformat()[: ROLLUP_PREFIX_LENGTHS[granularity]]
+
+SUMMARY_COLUMNS_SQL = """
+  COUNT(*) as total,
+  COALESCE(SUM(CASE WHEN label = 'Benign' THEN 1 ELSE 0 END), 0) as normal,
+  COALESCE(SUM(CASE WHEN label != 'Benign' THEN 1 ELSE 0 END), 0) as non_normal
+"""
+
+ROLLUP_SUMMARY_COLUMNS_SQL = """
+  COALESCE(SUM(count), 0) as total,
+  COALESCE(SUM(CASE WHEN label = 'Benign' THEN count ELSE 0 END), 0) as normal,
+  COALESCE(SUM(CASE WHEN label != 'Benign' THEN count ELSE 0 END), 0) as non_normal
+"""
+
+def parse_report_filters(args) -> Dict[str, Any]:
+    """REPORT_FILTERS values present in ``args``; raises ValueError for bad values."""
+    filters = {}
+    for name, (_, convert) in REPORT_FILTERS.items():
+        value = args.get(name)
+        if value is None or str(value).strip() == "":
+            continue
+        try:
+            filters[name] = convert(str(value).strip())
+        except ValueError as exception:
+            raise ValueError(f"Invalid value for {name}: {value!r}") from exception
+    return filters
+
+def report_filter_sql(filters: Optional[Dict[str, Any]]):
+    """WHERE conditions and parameters for parsed REPORT_FILTERS values."""
+    where, params = [], []
+    for name, value in (filters or {}).items():
+        where.append(REPORT_FILTERS[name][0])
+        params.append(value)
+    return where, params
+
+def report_summary(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Dict[str, int]:
+    """Report counts for ``date_from <= created_at <= date_to`` and ``filters``.
+
+    Whole days and hours inside the range are read from the rollups; only
+    the partial hours at either end are counted from the reports table.
+    Bounds that are not ISO timestamps, and filters other than ``label``
+    (which the rollups do not break down by), fall back to an index scan.
+    Each partition in the range is counted on its own and the results summed.
+    """
+    filters = filters or {}
+    rollup_ranges, scan_ranges = _summary_plan(date_from, date_to, filters)
+    summary = dict.fromkeys(("total", "normal", "non_normal"), 0)
+    for _, path in _partitions_for(date_from, date_to):
+        with connection(path) as conn:
+            for counts in (
+                _scan_summary(conn, scan_ranges, filters),
+                _rollup_summary(conn, rollup_ranges, filters),
+            ):
+                for key in summary:
+                    summary[key] += counts[key]
+    return summary
+
+def _summary_plan(date_from: Optional[str], date_to: Optional[str], filters: Dict[str, Any]):
+    """Split a summary range into (rollup ranges, reports table scan ranges).
+
+    Rollup ranges are (granularity, first bucket, end bucket), half-open,
+    with None for unbounded; scan ranges are (low, low inclusive, high,
+    high inclusive).
+    """
+    lower, upper = _parse_bound(date_from), _parse_bound(date_to)
+    if (date_from and lower is None) or (date_to and upper is None) or set(filters) - {"label"}:
+        return [], [(date_from, True, date_to, True)]
+
+    hour, day = timedelta(hours=1), timedelta(days=1)
+    hours_start = _ceil(lower, hour) if lower else None
+    hours_end = _floor(upper, hour) if upper else None
+    if hours_start and hours_end and hours_start >= hours_end:
+        return [], [(lower.isoformat(), True, upper.isoformat(), True)]
+
+    rollup_ranges = []
+    days_start = _ceil(hours_start, day) if hours_start else None
+    days_end = _floor(hours_end, day) if hours_end else None
+    if days_start is None or days_end is None or days_start < days_end:
+        rollup_ranges.append(
+            (
+                "day",
+                _bucket_key(days_start, "day") if days_start else None,
+                _bucket_key(days_end, "day") if days_end else None,
+            )
+        )
+        if hours_start and days_start and hours_start < days_start:
+            rollup_ranges.append(("hour", _bucket_key(hours_start, "hour"), _bucket_key(days_start, "hour")))
+        if hours_end and days_end and days_end < hours_end:
+            rollup_ranges.append(("hour", _bucket_key(days_end, "hour"), _bucket_key(hours_end, "hour")))
+    else:
+        rollup_ranges.append(("hour", _bucket_key(hours_start, "hour"), _bucket_key(hours_end, "hour")))
+
+    # Partial hours at the ends.
+    scan_ranges = []
+    if lower and lower < hours_start:
+        scan_ranges.append((lower.isoformat(), True, hours_start.isoformat(), False))
+    if upper:
+        scan_ranges.append((hours_end.isoformat(), True, upper.isoformat(), True))
+    return rollup_ranges, scan_ranges
+
+def _rollup_summary(conn: sqlite3.Connection, ranges: List[tuple], filters: Dict[str, Any]) -> Dict[str, int]:
+    summary = dict.fromkeys(("total", "normal", "non_normal"), 0)
+    for granularity, first, end in ranges:
+        where, params = report_filter_sql(filters)
+        where.append("granularity = ?")
+        params.append(granularity)
+        if first is not None:
+            where.append("bucket >= ?")
+            params.append(first)
+        if end is not None:
+            where.append("bucket < ?")
+            params.append(end)
+        row = conn.execute(
+            f"SELECT {ROLLUP_SUMMARY_COLUMNS_SQL} FROM report_rollups WHERE {' AND '.join(where)}",
+            params,
+        ).fetchone()
+        for key in summary:
+            summary[key] += row[key]
+    return summary
+
+def _scan_summary(conn: sqlite3.Connection, ranges: List[tuple], filters: Dict[str, Any]) -> Dict[str, int]:
+    summary = dict.fromkeys(("total", "normal", "non_normal"), 0)
+    for low, low_inclusive, high, high_inclusive in ranges:
+        where, params = report_filter_sql(filters)
+        if low:
+            where.append("created_at >= ?" if low_inclusive else "created_at > ?")
+            params.append(low)
+        if high:
+            where.append("created_at <= ?" if high_inclusive else "created_at < ?")
+            params.append(high)
+        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+        row = conn.execute(f"SELECT {SUMMARY_COLUMNS_SQL} FROM reports {where_sql}", params).fetchone()
+        for key in summary:
+            summary[key] += row[key]
+    return summary
+
+
+def report_aggregate(date_from: Optional[str], date_to: Optional[str], bucket_hours: int = 0, max_points: int = 100):
+    """Per-bucket report statistics for charts.
+
+    Buckets are ``bucket_hours`` wide (0 picks the finest width that fits),
+    aligned to the Unix epoch and widened until at most ``max_points`` cover
+    the range, so the result size does not depend on the number of reports.
+    Every bucket in the range is returned, empty ones included.  Counts are
+    exact and come from the rollups plus a scan of the partial hours at
+    either end, as in report_summary; the confidence mean is exact and the
+    percentiles are read from the confidence histogram, to within
+    1 / CONFIDENCE_BINS.  ``date_from`` defaults to the oldest report and
+    ``date_to`` to now.  Raises ValueError for bounds that are not ISO
+    timestamps.
+    """
+    lower, upper = _parse_bound(date_from), _parse_bound(date_to)
+    if (date_from and lower is None) or (date_to and upper is None):
+        raise ValueError("from and to must be ISO timestamps")
+    upper = upper or datetime.now(timezone.utc)
+    lower = lower or _oldest_report_time()
+    width = _aggregate_width(lower, upper, bucket_hours or 1, max_points) if lower and lower <= upper else None
+    result = {"from": date_from, "to": upper.isoformat(), "bucket_hours": width, "points": []}
+    if width is None:
+        return result
+
+    seconds = width * 3600
+    first = int(lower.timestamp()) // seconds
+    points = [
+        {
+            "start": datetime.fromtimestamp((first + index) * seconds, timezone.utc).isoformat(),
+            "total": 0,
+            "labels": Counter(),
+            "statuses": Counter(),
+            "histogram": [0] * CONFIDENCE_BINS,
+            "confidence_sum": 0.0,
+        }
+        for index in range(int(upper.timestamp()) // seconds - first + 1)
+    ]
+
+    bucket_points: Dict[str, Dict[str, Any]] = {}
+
+    def point(bucket: str) -> Dict[str, Any]:
+        if bucket not in bucket_points:
+            bucket_points[bucket] = points[int(_bucket_start(bucket).timestamp()) // seconds - first]
+        return bucket_points[bucket]
+
+    rollup_ranges, scan_ranges = _summary_plan(lower.isoformat(), upper.isoformat(), {})
+    if width % 24:
+        # Day rollups cannot be split across narrower buckets.
+        rollup_ranges = [
+            ("hour", first_key + "T00", end_key + "T00") if granularity == "day" else (granularity, first_key, end_key)
+            for granularity, first_key, end_key in rollup_ranges
+        ]
+    for _, path in _partitions_for(lower.isoformat(), upper.isoformat()):
+        with connection(path) as conn:
+            for bucket, label, status, count in _aggregate_counts(conn, rollup_ranges, scan_ranges):
+                target = point(bucket)
+                target["total"] += count
+                target["labels"][label] += count
+                target["statuses"][status] += count
+            for bucket, confidence_bin, count, confidence_sum in _aggregate_confidence(conn, rollup_ranges, scan_ranges):
+                target = point(bucket)
+                target["histogram"][confidence_bin] += count
+                target["confidence_sum"] += confidence_sum
+
+    for target in points:
+        histogram = target.pop("histogram")
+        confidence_sum = target.pop("confidence_sum")
+        target["labels"] = dict(target["labels"])
+        target["statuses"] = dict(target["statuses"])
+        target["confidence"] = None
+        if target["total"]:
+            target["confidence"] = {
+                "mean": round(confidence_sum / target["total"], 4),
+                "p50": _histogram_percentile(histogram, target["total"], 0.50),
+                "p90": _histogram_percentile(histogram, target["total"], 0.90),
+                "p95": _histogram_percentile(histogram, target["total"], 0.95),
+            }
+    result["from"] = lower.isoformat()
+    result["points"] = points
+    return result
+
+def _oldest_report_time() -> Optional[datetime]:
+    for _, path in list_partitions():
+        with connection(path) as conn:
+            oldest = conn.execute("SELECT MIN(created_at) FROM reports").fetchone()[0]
+        if oldest is not None:
+            return _parse_bound(oldest)
+    return None
+
+def _aggregate_width(lower: datetime, upper: datetime, hours: int, max_points: int) -> int:
+    """Smallest multiple of ``hours`` whose epoch-aligned buckets cover the range in ``max_points``."""
+    width = hours
+    while True:
+        seconds = width * 3600
+        count = int(upper.timestamp()) // seconds - int(lower.timestamp()) // seconds + 1
+        if count <= max_points:
+            return width
+        width *= -(-count // max_points)
+        if width < 24 and 24 % hours == 0:
+            # Keep buckets that tile a day (2h, 3h, 4h, 6h, 8h, 12h).
+            width = next(divisor for divisor in (2, 3, 4, 6, 8, 12, 24) if divisor >= width and divisor % hours == 0)
+        elif width > 24 and width % 24:
+            # Whole days can be read from the day rollups; rounding up to a
+            # multiple of lcm(hours, 24) keeps the width a multiple of hours.
+            days = math.lcm(hours, 24)
+            width = -(-width // days) * days
+
+def _bucket_start(bucket: str) -> datetime:
+    """Start of a rollup bucket key ("2024-05-01" or "2024-05-01T13")."""
+    return datetime.fromisoformat(bucket).replace(tzinfo=timezone.utc)
+
+def _aggregate_counts(conn: sqlite3.Connection, rollup_ranges: List[tuple], scan_ranges: List[tuple]):
+    """(bucket, label, decision_status, count) rows over the plan from _summary_plan."""
+    for granularity, first, end in rollup_ranges:
+        yield from conn.execute(
+            "SELECT bucket, label, decision_status, count FROM report_rollups"
+            " WHERE granularity = ? AND bucket >= ? AND bucket < ?",
+            (granularity, first, end),
+        )
+    for where_sql, params in _scan_where(scan_ranges):
+        yield from conn.execute(
+            f"SELECT substr(created_at, 1, 13), label, decision_status, COUNT(*) FROM reports {where_sql}"
+            " GROUP BY 1, 2, 3",
+            params,
+        )
+
+def _aggregate_confidence(conn: sqlite3.Connection, rollup_ranges: List[tuple], scan_ranges: List[tuple]):
+    """(bucket, bin, count, confidence_sum) rows over the plan from _summary_plan."""
+    for granularity, first, end in rollup_ranges:
+        yield from conn.execute(
+            "SELECT bucket, bin, count, confidence_sum FROM confidence_rollups"
+            " WHERE granularity = ? AND bucket >= ? AND bucket < ?",
+            (granularity, first, end),
+        )
+    for where_sql, params in _scan_where(scan_ranges):
+        yield from conn.execute(
+            f"SELECT substr(created_at, 1, 13), {CONFIDENCE_BIN_SQL}, COUNT(*), SUM(confidence) FROM reports"
+            f" {where_sql} GROUP BY 1, 2",
+            params,
+        )
+
+def _scan_where(scan_ranges: List[tuple]):
+    for low, low_inclusive, high, high_inclusive in scan_ranges:
+        yield (
+            f"WHERE created_at {'>=' if low_inclusive else '>'} ? AND created_at {'<=' if high_inclusive else '<'} ?",
+            [low, high],
+        )
+
+def _histogram_percentile(histogram: List[int], total: int, fraction: float) -> float:
+    """Percentile of a confidence histogram, interpolated inside its bin."""
+    rank = fraction * total
+    seen = 0
+    for confidence_bin, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            return round((confidence_bin + (rank - seen) / count) / CONFIDENCE_BINS, 4)
+        seen += count
+    return 1.0
+
+
+class ReportWriteError(RuntimeError):
+    """Raised when buffered reports could not be written to the database."""
+
+
+class ReportWriter:
+    """Write-behind buffer for reports.
+
+    ``add`` only buffers the row (``created_at`` is stamped at that moment).
+    A background thread flushes the buffer with one executemany transaction
+    once ``max_rows`` rows are waiting or every ``flush_interval`` seconds,
+    and the buffer is flushed once more on interpreter shutdown.
+
+    A failed flush keeps its rows buffered for the next attempt, logs the
+    error and records it in ``stats()``.  ``flush()`` called directly raises
+    ReportWriteError.  If the database stays unavailable, the oldest rows
+    beyond ``max_buffered`` are dropped and counted.
+    """
+
+    def __init__(self, max_rows: int = 500, flush_interval: float = 1.0, max_buffered: int = 100_000):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._rows: List[tuple] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.last_error: Optional[str] = None
+        self._thread = threading.Thread(target=self._run, name="report-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, **report):
+        self.add_many([report])
+
+    def add_many(self, reports: List[Dict[str, Any]]):
+        rows = [_report_row(**report) for report in reports]
+        with self._lock:
+            if self._closed:
+                raise ReportWriteError("Report writer is closed")
+            self._rows.extend(rows)
+            pending = len(self._rows)
+        if pending >= self.max_rows:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write every buffered row now; returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                _write_rows(rows)
+            except Exception as exception:
+                # Any failure (including OSError from creating a partition
+                # file) puts the rows back; none of them may be lost here.
+                with self._lock:
+                    self._rows[:0] = rows
+                    overflow = len(self._rows) - self.max_buffered
+                    if overflow > 0:
+                        del self._rows[:overflow]
+                        self.dropped += overflow
+                    self.failed_flushes += 1
+                    self.last_error = f"{type(exception).__name__}: {exception}"
+                raise ReportWriteError(f"Failed to write {len(rows)} reports: {exception}") from exception
+            with self._lock:
+                self.written += len(rows)
+                self.flushes += 1
+                self.last_error = None
+            return len(rows)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        try:
+            self.flush()
+        except ReportWriteError:
+            logger.exception("Reports still buffered at shutdown could not be written")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._rows),
+                "written": self.written,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "dropped": self.dropped,
+                "last_error": self.last_error,
+            }
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except ReportWriteError:
+                logger.exception("Background report flush failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance commands for the reports database.")
+    parser.add_argument("command", choices=["rebuild-rollups", "apply-retention", "compact"])
+    parser.add_argument("--db", default=None, help="Path to reports.db (defaults to the backend database)")
+    parser.add_argument("--months", type=int, default=None, help="apply-retention: months to keep")
+    parser.add_argument("--action", choices=["archive", "drop"], default=None, help="apply-retention: what to do")
+    args = parser.parse_args()
+
+    global DB_PATH
+    if args.db:
+        DB_PATH = Path(args.db)
+    init_db()
+    if args.command == "rebuild-rollups":
+        print(json.dumps({"reports": rebuild_rollups(), "db": str(DB_PATH)}))
+    elif args.command == "apply-retention":
+        print(json.dumps({"retired": apply_retention(args.months, args.action), "db": str(DB_PATH)}))
+    else:
+        print(json.dumps({"compacted": compact_partitions(), "db": str(DB_PATH)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# backend/storage_benchmark.py
+"""Read latency of the reports page while analyses are writing reports.
+
+Runs the same workload twice against fresh temporary databases:
+
+* ``legacy``: one table, a new connection per operation and the default
+  rollback journal (how storage.py worked before the connection pool);
+* ``pooled``: storage's own write and read paths (pooled WAL connections,
+  monthly partitions, rollup summaries).
+
+Usage: python storage_benchmark.py --seconds 5 --writers 4 --readers 4
+"""
+import argparse
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import storage
+
+SUMMARY_SQL = """
+SELECT
+  COUNT(*) as total,
+  COALESCE(SUM(CASE WHEN label = 'Benign' THEN 1 ELSE 0 END), 0) as normal,
+  COALESCE(SUM(CASE WHEN label != 'Benign' THEN 1 ELSE 0 END), 0) as non_normal
+FROM reports
+"""
+PAGE_SQL = "SELECT id, created_at, label, confidence FROM reports ORDER BY created_at DESC, id DESC LIMIT 50"
+PAGE_FIELDS = ("id", "created_at", "label", "confidence")
+
+
+def _sample_report(index: int) -> dict:
+    return {
+        "label": "Benign" if index % 3 else "DDoS",
+        "confidence": 0.5 + (index % 50) / 100,
+        "decision_status": "Verified Threat" if index % 3 == 0 else "Normal",
+        "decision_reason": "benchmark",
+        "traffic_context": {"source_ip": f"10.0.{index % 256}.{index % 200}", "destination_port": 443},
+        "raw_input": {"features": {"Flow Duration": float(index)}},
+    }
+
+
+class _LegacyStore:
+    def __init__(self, path: Path):
+        self.path = path
+        conn = sqlite3.connect(path)
+        conn.executescript(storage.SCHEMA)
+        conn.close()
+
+    def write(self, rows):
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                conn.executemany(storage.INSERT_SQL, [(None, *row) for row in rows])
+        finally:
+            conn.close()
+
+    def read(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute(SUMMARY_SQL).fetchone()
+            conn.execute(PAGE_SQL).fetchall()
+        finally:
+            conn.close()
+
+
+class _PooledStore:
+    def __init__(self, path: Path):
+        storage.DB_PATH = path
+        storage.init_db()
+
+    def write(self, rows):
+        storage._write_rows(rows)
+
+    def read(self):
+        storage.report_summary()
+        storage.list_reports(fields=PAGE_FIELDS, limit=50)
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_workload(store, seconds: float, writers: int, readers: int, batch_rows: int, seed_rows: int) -> dict:
+    store.write([storage._report_row(**_sample_report(index)) for index in range(seed_rows)])
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies: list[float] = []
+    counters = {"rows_written": 0, "write_errors": 0, "read_errors": 0}
+
+    def writer():
+        index = 0
+        while not stop.is_set():
+            rows = [storage._report_row(**_sample_report(index + offset)) for offset in range(batch_rows)]
+            index += batch_rows
+            try:
+                store.write(rows)
+            except sqlite3.OperationalError:
+                with lock:
+                    counters["write_errors"] += 1
+                continue
+            with lock:
+                counters["rows_written"] += batch_rows
+
+    def reader():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                store.read()
+            except sqlite3.OperationalError:
+                with lock:
+                    counters["read_errors"] += 1
+                continue
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "reads": len(latencies),
+        "reads_per_second": round(len(latencies) / seconds, 1),
+        "read_latency_ms": {
+            "p50": round(_percentile(latencies, 0.50), 3),
+            "p95": round(_percentile(latencies, 0.95), 3),
+            "p99": round(_percentile(latencies, 0.99), 3),
+            "max": round(max(latencies, default=0.0), 3),
+        },
+        "rows_written_per_second": round(counters["rows_written"] / seconds, 1),
+        "write_errors": counters["write_errors"],
+        "read_errors": counters["read_errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure report read latency under concurrent writes, legacy vs pooled WAL connections."
+    )
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each run")
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent writer threads")
+    parser.add_argument("--readers", type=int, default=4, help="Concurrent reader threads")
+    parser.add_argument("--batch-rows", type=int, default=50, help="Reports per write transaction")
+    parser.add_argument("--seed-rows", type=int, default=20_000, help="Reports inserted before timing")
+    args = parser.parse_args()
+
+    report = {"config": vars(args), "modes": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, store_cls in (("legacy", _LegacyStore), ("pooled", _PooledStore)):
+            store = store_cls(Path(directory) / f"{mode}.db")
+            report["modes"][mode] = run_workload(
+                store, args.seconds, args.writers, args.readers, args.batch_rows, args.seed_rows
+            )
+        storage._close_pool()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()